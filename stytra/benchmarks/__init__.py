@@ -0,0 +1,7 @@
+"""
+Benchmarks for the performance-critical parts of Stytra. Each module can be
+run as a script, e.g.
+
+    python -m stytra.benchmarks.parallel_tracking
+
+"""
@@ -0,0 +1,129 @@
+"""
+Memory and call latency of the array-backed DataFrameAccumulator, compared
+with the previous implementation which kept one namedtuple per sample in
+a list and built a DataFrame at every query. Samples are added in batches,
+as they are received from the tracking at every GUI update.
+
+    python -m stytra.benchmarks.accumulators --n-samples 1440000
+
+"""
+import argparse
+import tracemalloc
+from collections import namedtuple
+from datetime import datetime
+from time import perf_counter
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+
+from stytra.collectors.accumulators import DataFrameAccumulator
+
+
+class ListAccumulator:
+    """ The storage and queries of the list-based DataFrameAccumulator """
+
+    def __init__(self):
+        self.stored_data = []
+        self.times = []
+
+    def append(self, t, data):
+        self.times.append(t)
+        self.stored_data.append(data)
+
+    def get_fps(self, fps_calc_points=10):
+        return fps_calc_points / (self.times[-1] - self.times[-fps_calc_points])
+
+    def get_last_n(self, n):
+        last_n = min(n, len(self.stored_data))
+        df = pd.DataFrame.from_records(
+            self.stored_data[-last_n:], columns=self.stored_data[-1]._fields
+        )
+        df["t"] = np.array(self.times[-last_n:])
+        return df
+
+    def get_last_t(self, t):
+        return self.get_last_n(int(self.get_fps() * t))
+
+
+def make_experiment():
+    return SimpleNamespace(
+        t0=datetime.now(), protocol_runner=SimpleNamespace(running=True)
+    )
+
+
+def fill(acc, tuple_type, n_samples, dt, batch=13):
+    """ Adds n_samples samples the way the tracking accumulator receives
+    them at each GUI update, returns the time per sample
+    """
+    n_fields = len(tuple_type._fields)
+    t_start = perf_counter()
+    for i_batch in range(0, n_samples, batch):
+        indices = range(i_batch, min(i_batch + batch, n_samples))
+        if isinstance(acc, ListAccumulator):
+            for i in indices:
+                values = tuple_type(*(float(i + k) for k in range(n_fields)))
+                acc.append(i * dt, values)
+        else:
+            times = np.array(indices) * dt
+            acc.append_batch(times, times[:, None] + np.arange(n_fields))
+    return (perf_counter() - t_start) / n_samples
+
+
+def memory_per_sample(make_acc, tuple_type, n_samples, dt):
+    tracemalloc.start()
+    acc = make_acc()
+    fill(acc, tuple_type, n_samples, dt)
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return current / n_samples
+
+
+def query_latency(fun, n_repeats=200):
+    t_start = perf_counter()
+    for _ in range(n_repeats):
+        fun()
+    return (perf_counter() - t_start) / n_repeats
+
+
+def compare(n_samples=100000, n_fields=10, framerate=400.0):
+    """ Times appending and querying the two accumulators filled with
+    n_samples samples, times in microseconds and memory in bytes
+    """
+    tuple_type = namedtuple("t", ["x{:02d}".format(i) for i in range(n_fields)])
+    dt = 1 / framerate
+
+    def make_array_acc():
+        acc = DataFrameAccumulator(experiment=make_experiment())
+        acc.set_fields(tuple_type._fields)
+        return acc
+
+    results = dict()
+    for name, make_acc in [("list", ListAccumulator), ("array", make_array_acc)]:
+        acc = make_acc()
+        append_time = fill(acc, tuple_type, n_samples, dt, int(framerate / 30))
+        results[name] = dict(
+            bytes_per_sample=memory_per_sample(make_acc, tuple_type, n_samples, dt),
+            append_us=append_time * 1e6,
+            last_20_us=query_latency(lambda: acc.get_last_n(20)) * 1e6,
+            last_2000_us=query_latency(lambda: acc.get_last_n(2000)) * 1e6,
+            last_5s_us=query_latency(lambda: acc.get_last_t(5.0)) * 1e6,
+        )
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--n-samples", type=int, default=100000)
+    parser.add_argument("--n-fields", type=int, default=10)
+    args = parser.parse_args()
+
+    results = compare(args.n_samples, args.n_fields)
+    measures = list(results["list"].keys())
+    print("{:>18} {:>12} {:>12}".format("", "list", "array"))
+    for measure in measures:
+        print(
+            "{:>18} {:>12.2f} {:>12.2f}".format(
+                measure, results["list"][measure], results["array"][measure]
+            )
+        )
@@ -0,0 +1,114 @@
+"""
+Per-call cost of the vigor estimate. The previous VigorMotionEstimator took
+the last samples of the tracking accumulator as a DataFrame and computed
+their standard deviation at every stimulus frame; now the tracking process
+updates rolling moments with each sample and the stimulus reads the
+latest estimate from shared memory.
+
+    python -m stytra.benchmarks.estimators --n-samples 20000
+
+"""
+import argparse
+from collections import namedtuple
+from datetime import datetime
+from time import perf_counter
+from types import SimpleNamespace
+
+import numpy as np
+
+from stytra.benchmarks.accumulators import ListAccumulator
+from stytra.stimulation.estimators import (
+    OnlineVigor,
+    OnlineTailSum,
+    VigorMotionEstimator,
+)
+from stytra.collectors.accumulators import EstimatorLog
+
+
+def legacy_vigor(acc, vigor_window, last_dt, lag=0):
+    """ The vigor computation of the previous VigorMotionEstimator """
+    vigor_n_samples = max(int(round(vigor_window / last_dt)), 2)
+    n_samples_lag = max(int(round(lag / last_dt)), 0)
+    past_tail_motion = acc.get_last_n(vigor_n_samples + n_samples_lag)[
+        0:vigor_n_samples
+    ]
+    return np.nanstd(np.array(past_tail_motion.tail_sum))
+
+
+def make_estimator():
+    exp = SimpleNamespace(
+        t0=datetime.now(), protocol_runner=SimpleNamespace(running=True)
+    )
+    exp.estimator_log = EstimatorLog(experiment=exp)
+    return VigorMotionEstimator(None, experiment=exp)
+
+
+def time_per_call(fun, n_repeats):
+    t_start = perf_counter()
+    for i in range(n_repeats):
+        fun(i)
+    return (perf_counter() - t_start) / n_repeats
+
+
+def compare(n_samples=20000, framerate=500.0, vigor_window=0.05):
+    """ Times in microseconds per sample (tracking side) and per call
+    (stimulus side)
+    """
+    tuple_type = namedtuple(
+        "t", ["tail_sum"] + ["theta_{:02d}".format(i) for i in range(9)]
+    )
+    dt = 1 / framerate
+    tail_sums = np.sin(np.arange(n_samples) * dt * 20) + 0.1 * np.random.randn(
+        n_samples
+    )
+    samples = [tuple_type(x, *([0.0] * 9)) for x in tail_sums]
+
+    acc = ListAccumulator()
+    for i, sample in enumerate(samples):
+        acc.append(i * dt, sample)
+    results = dict(
+        legacy_get_velocity_us=time_per_call(
+            lambda i: legacy_vigor(acc, vigor_window, dt), 2000
+        )
+        * 1e6,
+        legacy_get_velocity_lag_us=time_per_call(
+            lambda i: legacy_vigor(acc, vigor_window, dt, lag=0.1), 2000
+        )
+        * 1e6,
+    )
+
+    t_start = datetime.now().timestamp()
+    onlines = dict(
+        vigor=OnlineVigor(vigor_window), tail_sum=OnlineTailSum(vigor_window)
+    )
+    for name, online in onlines.items():
+        results[name + "_update_us"] = (
+            time_per_call(
+                lambda i: online.process(t_start + i * dt, samples[i]), n_samples
+            )
+            * 1e6
+        )
+
+    estimator = make_estimator()
+    estimator.online = online = onlines["vigor"]
+    results["get_velocity_us"] = (
+        time_per_call(lambda i: estimator.get_velocity(), 20000) * 1e6
+    )
+    results["get_velocity_lag_us"] = (
+        time_per_call(lambda i: estimator.get_velocity(0.1), 20000) * 1e6
+    )
+    # the rolling estimate agrees with the window computation
+    results["max_difference"] = abs(
+        online.output.get()[2].vigor - legacy_vigor(acc, vigor_window, dt)
+    )
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--n-samples", type=int, default=20000)
+    parser.add_argument("--framerate", type=float, default=500.0)
+    args = parser.parse_args()
+
+    for measure, value in compare(args.n_samples, args.framerate).items():
+        print("{:>28} {:>12.3g}".format(measure, value))
@@ -0,0 +1,150 @@
+"""
+Headless measurement of the closed-loop latency. A video file is replayed
+by a VideoFileSource at the camera framerate, tracked as in the
+TrackingExperiment with the estimator running in the tracking process, and
+the estimates are read at the stimulus update rate as a closed-loop
+stimulus would do. No projector or GUI is needed; the display stage is not
+measured.
+
+    python -m stytra.benchmarks.latency --pipeline tail --framerate 300
+
+"""
+import argparse
+import json
+import time
+from multiprocessing import set_start_method
+from pathlib import Path
+from queue import Empty
+
+from stytra.benchmarks.parallel_tracking import start_tracking, stop_tracking
+from stytra.collectors.latency import LatencyMonitor
+from stytra.experiments.fish_pipelines import pipeline_dict
+from stytra.hardware.video import VideoFileSource
+from stytra.stimulation.estimators import OnlineVigor, OnlinePosition
+
+EXAMPLE_ASSETS = Path(__file__).parent.parent / "examples" / "assets"
+
+
+def measure_latency(
+    video_file,
+    pipeline,
+    online_estimator,
+    n_processes=1,
+    framerate=100.0,
+    stimulus_rate=60.0,
+    duration=20.0,
+    warmup=10.0,
+):
+    """ Replays a video through the tracking and the estimator and
+    measures the latencies from the frame timestamps
+
+    Parameters
+    ----------
+    video_file: str
+        video replayed by the VideoFileSource
+    pipeline: Pipeline class
+    online_estimator: OnlineEstimator
+    n_processes: int
+        number of tracking processes
+    framerate: float
+        replay framerate
+    stimulus_rate: float
+        rate at which the estimates are read
+    duration: float
+        duration of the measurement in seconds
+    warmup: float
+        time given to the processes to start and compile before measuring
+
+    Returns
+    -------
+    LatencyMonitor with the measurements
+
+    """
+    camera = VideoFileSource(source_file=str(video_file), loop=True)
+    camera.n_consumers = n_processes
+    camera.control_queue.put(dict(framerate=framerate, offset=0))
+    processes, output_queue = start_tracking(
+        pipeline,
+        n_processes,
+        camera.frame_queue,
+        camera.kill_event,
+        estimator=online_estimator,
+    )
+    camera.start()
+
+    monitor = LatencyMonitor()
+    estimates = online_estimator.output
+    estimate_seq = 0
+    last_frame_time = None
+    t_start = time.time()
+    measuring = False
+    while time.time() - t_start < warmup + duration:
+        if not measuring and time.time() - t_start > warmup:
+            monitor.reset()
+            measuring = True
+
+        try:
+            times, _, _ = output_queue.get_batch()
+            monitor.add("tracking", output_queue.write_times - times)
+            monitor.add("gui", time.time() - times)
+        except Empty:
+            pass
+
+        frame_times, write_times, estimate_seq = estimates.get_times_since(
+            estimate_seq
+        )
+        monitor.add("estimator", write_times - frame_times)
+
+        # what a closed-loop stimulus gets at its update
+        estimate = estimates.get()
+        if estimate is not None and estimate[0] != last_frame_time:
+            last_frame_time = estimate[0]
+            monitor.add("stimulus", time.time() - last_frame_time)
+
+        time.sleep(1 / stimulus_rate)
+
+    stop_tracking(processes + [camera], camera.kill_event)
+    return monitor
+
+
+if __name__ == "__main__":
+    set_start_method("spawn", force=True)
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--pipeline", default="tail", choices=["tail", "fish"])
+    parser.add_argument("--video", default=None, help="video file to replay")
+    parser.add_argument("--processes", type=int, default=1)
+    parser.add_argument("--framerate", type=float, default=100.0)
+    parser.add_argument("--stimulus-rate", type=float, default=60.0)
+    parser.add_argument("--duration", type=float, default=20.0)
+    parser.add_argument("--warmup", type=float, default=10.0)
+    parser.add_argument("--json", default=None, help="file to save the results")
+    args = parser.parse_args()
+
+    if args.pipeline == "fish":
+        video, online = "fish_free_compressed.h5", OnlinePosition()
+    else:
+        video, online = "fish_compressed.h5", OnlineVigor()
+
+    monitor = measure_latency(
+        args.video or EXAMPLE_ASSETS / video,
+        pipeline_dict[args.pipeline],
+        online,
+        n_processes=args.processes,
+        framerate=args.framerate,
+        stimulus_rate=args.stimulus_rate,
+        duration=args.duration,
+        warmup=args.warmup,
+    )
+
+    summary = monitor.summary()
+    measures = ["n", "mean_ms", "p50_ms", "p90_ms", "p99_ms", "max_ms"]
+    print(("{:>10}" + " {:>9}" * len(measures)).format("", *measures))
+    for stage, stats in summary["stages"].items():
+        print(
+            ("{:>10} {:>9d}" + " {:>9.2f}" * (len(measures) - 1)).format(
+                stage, *(stats[m] for m in measures)
+            )
+        )
+    if args.json is not None:
+        with open(args.json, "w") as f:
+            json.dump(summary, f)
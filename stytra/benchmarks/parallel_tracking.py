@@ -0,0 +1,182 @@
+"""
+Throughput of tracking as a function of the number of tracking processes.
+Frames from the example video, upscaled to emulate a bigger camera sensor,
+are fed as quickly as the tracking processes take them, and the rate at
+which ordered results come out of the tracking output queue is measured.
+
+    python -m stytra.benchmarks.parallel_tracking --processes 1 2 4
+
+"""
+import argparse
+import time
+from multiprocessing import Event, Queue, set_start_method
+from pathlib import Path
+from queue import Empty
+
+import cv2
+import flammkuchen as fl
+from arrayqueues.shared_arrays import IndexedArrayQueue
+
+from stytra.collectors.shared_ring import SharedRecordRing
+from stytra.experiments.fish_pipelines import pipeline_dict
+from stytra.tracking.tracking_process import TrackingProcess, TrackingReorderProcess
+
+
+def load_example_frames(name="fish_compressed.h5", scale=1.0):
+    """ Loads the frames of one of the example videos, optionally rescaled
+    """
+    video = fl.load(
+        str(Path(__file__).parent.parent / "examples" / "assets" / name), "/video"
+    )
+    if scale != 1:
+        return [
+            cv2.resize(frame, None, fx=scale, fy=scale, interpolation=cv2.INTER_LINEAR)
+            for frame in video
+        ]
+    return list(video)
+
+
+def _drain(queue):
+    while True:
+        try:
+            queue.get(timeout=0.001)
+        except Empty:
+            break
+
+
+def start_tracking(
+    pipeline, n_processes, frame_queue, finished_signal, estimator=None
+):
+    """ Starts the tracking processes in the same configuration
+    as the TrackingExperiment, optionally with an OnlineEstimator
+
+    Returns
+    -------
+    processes and the ordered output queue
+
+    """
+    output_queue = SharedRecordRing()
+    if n_processes == 1:
+        processes = [
+            TrackingProcess(
+                frame_queue,
+                finished_signal,
+                pipeline,
+                Queue(),
+                output_queue,
+                estimator=estimator,
+            )
+        ]
+    else:
+        workers = [
+            TrackingProcess(
+                frame_queue,
+                finished_signal,
+                pipeline,
+                Queue(),
+                SharedRecordRing(),
+                worker_index=i,
+            )
+            for i in range(n_processes)
+        ]
+        processes = workers + [
+            TrackingReorderProcess(
+                [w.output_queue for w in workers],
+                output_queue,
+                finished_signal,
+                pipeline,
+                Queue(),
+                estimator=estimator,
+            )
+        ]
+    for process in processes:
+        process.start()
+    return processes, output_queue
+
+
+def stop_tracking(processes, finished_signal):
+    finished_signal.set()
+    for process in processes:
+        # processes do not terminate until their queues are emptied
+        while process.is_alive():
+            for queue in (process.message_queue, process.framerate_queue):
+                _drain(queue)
+            process.join(timeout=0.1)
+
+
+def measure_throughput(
+    pipeline, frames, n_processes, n_frames=2000, timeout=120.0
+):
+    """ Measures the number of frames per second which are tracked
+
+    Parameters
+    ----------
+    pipeline: Pipeline class
+    frames: list of frames which are fed in a loop
+    n_processes: number of tracking processes
+    n_frames: number of frames to track
+    timeout: maximal duration of the measurement in seconds
+
+    Returns
+    -------
+    frames per second
+
+    """
+    frame_queue = IndexedArrayQueue(max_mbytes=400)
+    finished_signal = Event()
+    processes, output_queue = start_tracking(
+        pipeline, n_processes, frame_queue, finished_signal
+    )
+    max_queued = 2 * n_processes + 2
+
+    i_frame = 0
+    n_received = 0
+    t_start = None
+    t_limit = time.process_time()
+    while n_received < n_frames:
+        if frame_queue.queue.qsize() < max_queued:
+            frame_queue.put(frames[i_frame % len(frames)])
+            i_frame += 1
+        try:
+            times, _, _ = output_queue.get_batch()
+        except Empty:
+            time.sleep(0.0001)
+            continue
+        # the clock starts at the first output, after the startup and compilation
+        if t_start is None:
+            t_start = time.time()
+            t_limit = t_start + timeout
+            continue
+        n_received += len(times)
+        if time.time() > t_limit:
+            break
+
+    fps = n_received / (time.time() - t_start)
+    stop_tracking(processes, finished_signal)
+    return fps
+
+
+if __name__ == "__main__":
+    set_start_method("spawn", force=True)
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--pipeline", default="tail", choices=list(pipeline_dict))
+    parser.add_argument("--processes", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--n-frames", type=int, default=2000)
+    parser.add_argument(
+        "--scale", type=float, default=4.0, help="upscaling of the example video"
+    )
+    args = parser.parse_args()
+
+    asset = "fish_free_compressed.h5" if args.pipeline == "fish" else "fish_compressed.h5"
+    frames = load_example_frames(asset, args.scale)
+    print(
+        "Pipeline {}, frames of {}x{}".format(args.pipeline, *frames[0].shape)
+    )
+    print("{:>10} {:>10} {:>8}".format("processes", "fps", "speedup"))
+    base_fps = None
+    for n_processes in args.processes:
+        fps = measure_throughput(
+            pipeline_dict[args.pipeline], frames, n_processes, args.n_frames
+        )
+        base_fps = base_fps or fps
+        print("{:>10d} {:>10.1f} {:>8.2f}".format(n_processes, fps, fps / base_fps))
@@ -0,0 +1,156 @@
+"""
+Python overhead of dispatching frames through a tracking pipeline.
+Pipelines made of nodes that do no work are run both with the compiled
+execution plan (Pipeline.run) and with the recursive tree walk
+(Pipeline.recursive_run), for trees of increasing size. The real pipelines
+are also timed node by node on the example video, to compare the
+dispatch overhead with the time spent in processing.
+
+    python -m stytra.benchmarks.pipeline_dispatch
+
+"""
+import argparse
+from collections import namedtuple
+from time import perf_counter
+
+import numpy as np
+
+from stytra.tracking.pipelines import (
+    Pipeline,
+    ImageToImageNode,
+    ImageToDataNode,
+    NodeOutput,
+)
+
+
+class PassNode(ImageToImageNode):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, name="pass", **kwargs)
+
+    def _process(self, im, **kwargs):
+        return NodeOutput([], im)
+
+
+class ConstantDataNode(ImageToDataNode):
+    def __init__(self, *args, prefix="x", n_fields=10, **kwargs):
+        super().__init__(*args, name="data", **kwargs)
+        self._output_type = namedtuple(
+            "t", ["{}{:02d}".format(prefix, i) for i in range(n_fields)]
+        )
+        self.values = self._output_type(*range(n_fields))
+
+    def _process(self, im, **kwargs):
+        return NodeOutput([], self.values)
+
+
+class SyntheticPipeline(Pipeline):
+    """ A chain of n_image image nodes, each branch ending
+    in a data node with n_fields outputs
+    """
+
+    def __init__(self, n_image=1, n_branches=1, n_fields=10):
+        super().__init__()
+        for i_branch in range(n_branches):
+            parent = self.root
+            for i_node in range(n_image):
+                parent = PassNode(parent=parent)
+                parent.name = "pass{}_{}".format(i_branch, i_node)
+            data = ConstantDataNode(
+                parent=parent, prefix="b{}_".format(i_branch), n_fields=n_fields
+            )
+            data.name = "data{}".format(i_branch)
+
+
+def time_per_run(fun, n_repeats):
+    t_start = perf_counter()
+    for _ in range(n_repeats):
+        fun()
+    return (perf_counter() - t_start) / n_repeats
+
+
+def dispatch_costs(n_repeats=20000):
+    """ Per-frame and per-node cost of running pipelines of nodes which do
+    no work, in microseconds
+    """
+    results = []
+    for n_image, n_branches in [(1, 1), (2, 1), (1, 2), (2, 2), (4, 4)]:
+        pipeline = SyntheticPipeline(n_image, n_branches)
+        pipeline.setup()
+        n_nodes = len(pipeline._plan)
+        # run once so that the output types are set
+        pipeline.run(None)
+        t_compiled = time_per_run(lambda: pipeline.run(None), n_repeats)
+        t_recursive = time_per_run(
+            lambda: pipeline.recursive_run(pipeline.root, None), n_repeats
+        )
+        results.append(
+            dict(
+                n_nodes=n_nodes,
+                compiled_us=t_compiled * 1e6,
+                compiled_per_node_us=t_compiled * 1e6 / n_nodes,
+                recursive_us=t_recursive * 1e6,
+                recursive_per_node_us=t_recursive * 1e6 / n_nodes,
+            )
+        )
+    return results
+
+
+def node_costs(pipeline_cls, frames):
+    """ Time spent in each node and in the complete run of a pipeline,
+    in microseconds per frame
+    """
+    pipeline = pipeline_cls()
+    pipeline.setup()
+    pipeline.run(frames[0])
+
+    node_times = {node.strpath: 0.0 for node, _ in pipeline._plan}
+    t_total = 0.0
+    for frame in frames:
+        # each node is run on the output of its parent, as in Pipeline.run
+        for i_slot, (node, i_parent) in enumerate(pipeline._plan):
+            t_start = perf_counter()
+            out = node.process(frame if i_parent < 0 else pipeline._slots[i_parent])
+            node_times[node.strpath] += perf_counter() - t_start
+            pipeline._slots[i_slot] = out.data
+        t_start = perf_counter()
+        pipeline.run(frame)
+        t_total += perf_counter() - t_start
+    n = len(frames)
+    return {k: v * 1e6 / n for k, v in node_times.items()}, t_total * 1e6 / n
+
+
+if __name__ == "__main__":
+    import flammkuchen as fl
+    from pathlib import Path
+    from stytra.experiments.fish_pipelines import pipeline_dict
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--n-repeats", type=int, default=20000)
+    args = parser.parse_args()
+
+    print("Dispatch cost of nodes doing no work (us)")
+    print(
+        "{:>6} {:>10} {:>10} {:>10} {:>10}".format(
+            "nodes", "compiled", "per node", "recursive", "per node"
+        )
+    )
+    for r in dispatch_costs(args.n_repeats):
+        print(
+            "{n_nodes:>6d} {compiled_us:>10.2f} {compiled_per_node_us:>10.2f} "
+            "{recursive_us:>10.2f} {recursive_per_node_us:>10.2f}".format(**r)
+        )
+
+    frames = fl.load(
+        str(Path(__file__).parent.parent / "examples/assets/fish_compressed.h5"),
+        "/video",
+    )
+    for name in ["tail", "eyes", "eyes_tail"]:
+        per_node, total = node_costs(pipeline_dict[name], frames)
+        print("\nPipeline {}: {:.1f} us per frame".format(name, total))
+        for path, t in per_node.items():
+            print("  {:<40} {:>8.1f} us".format(path, t))
+        print(
+            "  {:<40} {:>8.1f} us".format(
+                "dispatch overhead", total - sum(per_node.values())
+            )
+        )
@@ -0,0 +1,181 @@
+"""
+Time and memory per frame of the Prefilter, compared with the previous
+implementation which allocated a new image at every step. Random frames at
+typical camera resolutions are filtered with the default parameters.
+
+With --roi, the example tail video is placed in larger frames and the tail
+tracking pipeline is timed with the prefilter restricted to the region
+around the tail and on the complete frame.
+
+    python -m stytra.benchmarks.preprocessing
+    python -m stytra.benchmarks.preprocessing --roi
+
+"""
+import argparse
+import tracemalloc
+from time import perf_counter
+
+import cv2
+import flammkuchen as fl
+import numpy as np
+
+from stytra.benchmarks.tail import TAIL_VIDEO, TAIL_START, TAIL_LENGTH
+from stytra.experiments.fish_pipelines import TailTrackingPipeline
+from stytra.tracking.preprocessing import Prefilter
+
+RESOLUTIONS = [(480, 640), (1024, 1280), (2048, 2048)]
+
+
+
+def legacy_prefilter(
+    im, image_scale=0.5, filter_size=2, color_invert=True, clip=140, **extraparams
+):
+    """ The processing of the previous Prefilter """
+    if image_scale != 1:
+        im = cv2.resize(
+            im, None, fx=image_scale, fy=image_scale, interpolation=cv2.INTER_AREA
+        )
+    if filter_size > 0:
+        im = cv2.boxFilter(im, -1, (filter_size, filter_size))
+    if color_invert:
+        im = 255 - im
+    if clip > 0:
+        im = np.maximum(im, clip) - clip
+    return im
+
+
+def make_prefilter():
+    prefilter = Prefilter()
+    prefilter.setup()
+    return lambda im: prefilter._process(im, **prefilter._params.params.values).data
+
+
+def measure(process, frames, n_repeats=200):
+    """ Mean time per frame in ms, and extra memory used while
+    processing a frame in KB
+    """
+    process(frames[0])
+    t_start = perf_counter()
+    for i in range(n_repeats):
+        process(frames[i % len(frames)])
+    t_frame = (perf_counter() - t_start) / n_repeats
+
+    tracemalloc.start()
+    process(frames[1])
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return t_frame * 1000, peak / 1000
+
+
+def compare(resolutions=RESOLUTIONS, n_repeats=200):
+    np.random.seed(0)
+    results = dict()
+    for shape in resolutions:
+        frames = [np.random.randint(0, 255, shape).astype(np.uint8) for _ in range(4)]
+        prefilter = make_prefilter()
+        np.testing.assert_array_equal(
+            prefilter(frames[0]), legacy_prefilter(frames[0])
+        )
+        results[shape] = dict(
+            legacy=measure(legacy_prefilter, frames, n_repeats),
+            buffered=measure(prefilter, frames, n_repeats),
+        )
+    return results
+
+
+def embedded_tail_pipeline(video, shape, crop_to_roi):
+    """ The frames of the tail video placed in the middle of larger frames of
+    the given shape, and a tail tracking pipeline with the tail moved
+    accordingly
+    """
+    h, w = video.shape[1:]
+    oy, ox = (shape[0] - h) // 2, (shape[1] - w) // 2
+    frames = np.empty((len(video),) + tuple(shape), np.uint8)
+    frames[:] = np.median(video).astype(np.uint8)
+    frames[:, oy : oy + h, ox : ox + w] = video
+
+    start_y, start_x = TAIL_START
+    length_y, length_x = TAIL_LENGTH
+    pipeline = TailTrackingPipeline()
+    pipeline.setup()
+    pipeline.deserialize_params(
+        {
+            "/source/filtering": dict(
+                image_scale=0.5,
+                filter_size=2,
+                color_invert=True,
+                clip=140,
+                crop_to_roi=crop_to_roi,
+            ),
+            "/source/filtering/tail_tracking": dict(
+                tail_start=(
+                    (start_y * h + oy) / shape[0],
+                    (start_x * h + ox) / shape[0],
+                ),
+                tail_length=(length_y * h / shape[0], length_x * h / shape[0]),
+            ),
+        }
+    )
+    return frames, pipeline
+
+
+def compare_roi(resolutions=RESOLUTIONS, n_frames=200):
+    """ Time per frame in ms of the tail tracking with and without
+    restricting the prefilter to the tail region, and the largest
+    difference between the tracked angles
+    """
+    video = fl.load(str(TAIL_VIDEO), "/video")[:n_frames]
+    results = dict()
+    for shape in resolutions:
+        results[shape] = dict()
+        outputs = []
+        for crop in [False, True]:
+            frames, pipeline = embedded_tail_pipeline(video, shape, crop)
+            pipeline.run(frames[0])
+            t_start = perf_counter()
+            outputs.append([pipeline.run(frame).data for frame in frames])
+            results[shape]["roi" if crop else "full"] = (
+                (perf_counter() - t_start) / len(frames) * 1000
+            )
+        results[shape]["max_difference"] = np.nanmax(
+            np.abs(np.array(outputs[0]) - np.array(outputs[1]))
+        )
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--n-repeats", type=int, default=200)
+    parser.add_argument(
+        "--roi", action="store_true", help="compare the tail tracking with ROI"
+    )
+    args = parser.parse_args()
+
+    if args.roi:
+        print("{:>12} {:>14} {:>14} {:>14}".format("frame", "full ms", "roi ms", "max diff"))
+        for shape, result in compare_roi().items():
+            print(
+                "{:>12} {:>14.3f} {:>14.3f} {:>14.2g}".format(
+                    "{}x{}".format(*shape[::-1]),
+                    result["full"],
+                    result["roi"],
+                    result["max_difference"],
+                )
+            )
+        parser.exit()
+
+    print(
+        "{:>12} {:>14} {:>14} {:>14} {:>14}".format(
+            "frame", "legacy ms", "buffered ms", "legacy KB", "buffered KB"
+        )
+    )
+    for shape, result in compare(n_repeats=args.n_repeats).items():
+        print(
+            "{:>12} {:>14.3f} {:>14.3f} {:>14.1f} {:>14.1f}".format(
+                "{}x{}".format(*shape[::-1]),
+                result["legacy"][0],
+                result["buffered"][0],
+                result["legacy"][1],
+                result["buffered"][1],
+            )
+        )
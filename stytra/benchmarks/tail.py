@@ -0,0 +1,181 @@
+"""
+Time per frame of the center-of-mass tail tracing, compared with the
+previous implementation which called the jitted window function once per
+segment and smoothed and resampled the angles in Python. The frames of the
+example tail video are prefiltered once before the measurement.
+
+With --wells, the video is tiled in grids of wells and the time per frame of
+the multi-well tail tracking is measured as a function of the number of
+wells.
+
+    python -m stytra.benchmarks.tail --n-segments 12
+    python -m stytra.benchmarks.tail --wells
+
+"""
+import argparse
+from pathlib import Path
+from time import perf_counter
+
+import flammkuchen as fl
+import numpy as np
+from scipy.ndimage.filters import gaussian_filter1d
+
+from stytra.tracking.preprocessing import Prefilter
+from stytra.tracking.tail import (
+    CentroidTrackingMethod,
+    MultiTailTrackingMethod,
+    _next_segment,
+)
+
+TAIL_VIDEO = Path(__file__).parent.parent / "examples" / "assets" / "fish_compressed.h5"
+# tail position in the example video, in units of the image height
+TAIL_START = (0.47, 1.7)
+TAIL_LENGTH = (0.07, -1.36)
+GRIDS = [(1, 1), (2, 2), (3, 4), (4, 6), (8, 12)]
+
+
+def legacy_centroid(
+    im,
+    tail_start=TAIL_START,
+    tail_length=TAIL_LENGTH,
+    n_segments=12,
+    tail_filter_width=0.0,
+    n_output_segments=9,
+    window_size=7,
+    **extraparams
+):
+    """ The tracing of the previous CentroidTrackingMethod """
+    start_y, start_x = tail_start
+    tail_length_y, tail_length_x = tail_length
+    scale = im.shape[0]
+    length_tail = np.sqrt(tail_length_x ** 2 + tail_length_y ** 2) * scale
+    seg_length = length_tail / n_segments
+    n_segments += 1
+    disp_x = tail_length_x * scale / n_segments
+    disp_y = tail_length_y * scale / n_segments
+    angles = np.full(n_segments - 1, np.nan)
+    start_x *= scale
+    start_y *= scale
+    halfwin = window_size / 2
+    for i in range(1, n_segments):
+        start_x, start_y, disp_x, disp_y, acc = _next_segment(
+            im, start_x, start_y, disp_x, disp_y, halfwin, seg_length
+        )
+        if start_x < 0:
+            break
+        angles[i - 1] = np.arctan2(disp_x, disp_y)
+    angles = np.unwrap(angles)
+    if tail_filter_width > 0:
+        angles = gaussian_filter1d(angles, tail_filter_width, mode="nearest")
+    return np.interp(
+        np.linspace(0, 1, n_output_segments),
+        np.linspace(0, 1, n_segments - 1),
+        angles,
+    )
+
+
+def filtered_frames(n_frames=200):
+    video = fl.load(str(TAIL_VIDEO), "/video")[:n_frames]
+    prefilter = Prefilter()
+    prefilter.setup()
+    values = dict(
+        image_scale=0.5, filter_size=2, color_invert=True, clip=140, crop_to_roi=False
+    )
+    return [prefilter._process(frame, **values).data.copy() for frame in video]
+
+
+def make_tracker(**params):
+    tracker = CentroidTrackingMethod()
+    tracker.setup()
+    tracker._params.params.values = params
+    tracker.reset()
+    values = tracker._params.params.values
+    return lambda im: np.array(tracker._process(im, **values).data[1:]), values
+
+
+def time_per_frame(process, frames, n_repeats=2000):
+    process(frames[0])
+    t_start = perf_counter()
+    for i in range(n_repeats):
+        process(frames[i % len(frames)])
+    return (perf_counter() - t_start) / n_repeats
+
+
+def compare(n_segments=12, tail_filter_width=0.0, n_repeats=2000):
+    """ Times per frame in microseconds and the largest difference of the
+    angles
+    """
+    frames = filtered_frames()
+    tracker, values = make_tracker(
+        n_segments=n_segments,
+        tail_filter_width=tail_filter_width,
+        reset_zero=False,
+        time_filter_weight=0.0,
+    )
+    legacy = lambda im: legacy_centroid(im, **values)
+    difference = max(
+        np.nanmax(np.abs(tracker(frame) - legacy(frame)), initial=0)
+        for frame in frames
+    )
+    return dict(
+        legacy_us=time_per_frame(legacy, frames, n_repeats) * 1e6,
+        kernel_us=time_per_frame(tracker, frames, n_repeats) * 1e6,
+        max_difference=difference,
+    )
+
+
+def make_multi_tracker(frame_shape, n_rows, n_columns, **params):
+    """ Multi-well tracking of a grid of frames of the given shape, each
+    with the tail of the example video
+    """
+    h, w = frame_shape
+    height = h * n_rows
+    tracker = MultiTailTrackingMethod()
+    tracker.setup()
+    tracker._params.params.values = dict(
+        params,
+        tail_start=(TAIL_START[0] * h / height, TAIL_START[1] * h / height),
+        tail_length=(TAIL_LENGTH[0] * h / height, TAIL_LENGTH[1] * h / height),
+        grid_end=(
+            (TAIL_START[0] * h + (n_rows - 1) * h) / height,
+            (TAIL_START[1] * h + (n_columns - 1) * w) / height,
+        ),
+        n_rows=n_rows,
+        n_columns=n_columns,
+    )
+    tracker.reset()
+    values = tracker._params.params.values
+    return lambda im: np.array(tracker._process(im, **values).data), values
+
+
+def compare_wells(grids=GRIDS, n_repeats=500):
+    """ Time per frame in microseconds as a function of the number of wells
+    """
+    frames = filtered_frames()
+    results = dict()
+    for n_rows, n_columns in grids:
+        tiled = [np.tile(frame, (n_rows, n_columns)) for frame in frames[:20]]
+        tracker, _ = make_multi_tracker(frames[0].shape, n_rows, n_columns)
+        results[n_rows * n_columns] = (
+            time_per_frame(tracker, tiled, n_repeats) * 1e6
+        )
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--n-segments", type=int, default=12)
+    parser.add_argument("--tail-filter-width", type=float, default=0.0)
+    parser.add_argument("--n-repeats", type=int, default=2000)
+    parser.add_argument("--wells", action="store_true")
+    args = parser.parse_args()
+
+    if args.wells:
+        print("{:>8} {:>12} {:>12}".format("wells", "us/frame", "us/well"))
+        for n_wells, t_frame in compare_wells().items():
+            print("{:>8} {:>12.1f} {:>12.1f}".format(n_wells, t_frame, t_frame / n_wells))
+        parser.exit()
+
+    results = compare(args.n_segments, args.tail_filter_width, args.n_repeats)
+    for measure, value in results.items():
+        print("{:>16} {:>12.3g}".format(measure, value))
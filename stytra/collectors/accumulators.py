@@ -1,11 +1,13 @@
 from PyQt5.QtCore import QObject, pyqtSignal
 import datetime
 import numpy as np
+import time
+from numpy.lib.recfunctions import structured_to_unstructured
 from queue import Empty
 import pandas as pd
 from collections import namedtuple
-from bisect import bisect_right
 from os.path import basename
+import logging
 
 from stytra.utilities import save_df
 
@@ -15,29 +17,78 @@ class Accumulator(QObject):
         super().__init__()
         self.name = name
         self.exp = experiment
-        self.stored_data = []
-        self.times = []
         self.max_history_if_not_running = max_history_if_not_running
 
 
+class AccumulatorWindow:
+    """ View on a range of samples of a DataFrameAccumulator. The columns
+    can be accessed by name, as attributes or items, and are numpy views on
+    the accumulator storage, so they are valid only until the accumulator
+    is updated again.
+
+    Parameters
+    ----------
+    data : np.ndarray
+        J x N array, one row per column
+    header_dict : dict
+        index of each column name
+
+    """
+
+    def __init__(self, data, header_dict):
+        self.data = data
+        self.header_dict = header_dict
+
+    def __len__(self):
+        return self.data.shape[1]
+
+    @property
+    def shape(self):
+        return self.data.shape[::-1]
+
+    @property
+    def columns(self):
+        return tuple(self.header_dict.keys())
+
+    @property
+    def values(self):
+        """ NxJ array of the samples """
+        return self.data.T
+
+    def __getitem__(self, item):
+        if isinstance(item, str):
+            return self.data[self.header_dict[item]]
+        if isinstance(item, slice):
+            return AccumulatorWindow(self.data[:, item], self.header_dict)
+        # a list of column names gives a NxK array
+        return self.data[[self.header_dict[col] for col in item]].T
+
+    def __getattr__(self, item):
+        try:
+            return self.data[self.__dict__["header_dict"][item]]
+        except KeyError:
+            raise AttributeError(item)
+
+
 class DataFrameAccumulator(Accumulator):
     """Abstract class for accumulating streams of data.
 
     It is use to save or plot in real time data from stimulus logs or
-    behavior tracking. Data is stored in a list in the stored_data
-    attribute.
+    behavior tracking. Data is stored in a preallocated array with one row
+    per column, the first one being the time. The array grows by doubling
+    its size, and if max_length is set, it is used as a ring buffer keeping
+    only the last max_length samples.
 
     Specific methods
-    for updating the stored_data list (e.g., by acquiring data from a
+    for updating the data (e.g., by acquiring data from a
     Queue or a DynamicStimulus attribute) are defined in subclasses of the
     Accumulator.
 
-    Data that end up in the stored_data list must be NamedTuples where the first
-    element is a timestamp.
-    Therefore, stored_data of an Accumulator that is fed 2 values will be
-    something like
-    [(t_0, x_0, y_0), (t_0, x_0, y_0), ...]
-
+    The last samples can be retrieved without copying as an
+    :class:`AccumulatorWindow` with :meth:`get_last_n()
+    <DataFrameAccumulator.get_last_n()>` and :meth:`get_last_t()
+    <DataFrameAccumulator.get_last_t()>`, and a single sample as a namedtuple
+    by indexing the accumulator.
 
     Data can be retrieved from the Accumulator as a pandas DataFrame with the
     :meth:`get_dataframe() <Accumulator.get_dataframe()>` method.
@@ -47,6 +98,14 @@ class DataFrameAccumulator(Accumulator):
     ----------
     fps_calc_points : int
         number of data points used to calculate the sampling rate of the data.
+    initial_length : int
+        number of samples allocated at the beginning
+    max_length : int
+        if set, maximal number of samples kept
+    max_history_if_streaming : int
+        number of samples kept in memory while the data is
+        streamed to a file (see :meth:`start_streaming()
+        <DataFrameAccumulator.start_streaming()>`)
 
     Returns
     -------
@@ -58,23 +117,131 @@ class DataFrameAccumulator(Accumulator):
     sig_acc_reset = pyqtSignal()
     sig_acc_init = pyqtSignal()
 
-    def __init__(self, *args, fps_calc_points=10, monitored_headers=None, **kwargs):
+    def __init__(
+        self,
+        *args,
+        fps_calc_points=10,
+        monitored_headers=None,
+        initial_length=1024,
+        max_length=None,
+        max_history_if_streaming=20000,
+        **kwargs
+    ):
         super().__init__(*args, **kwargs)
         """ """
         self.plot_columns = monitored_headers
         self.fps_calc_points = fps_calc_points
+        self.initial_length = initial_length
+        self.max_length = max_length
+        self.max_history_if_streaming = max_history_if_streaming
         self._header_dict = None
+        self._tuple_type = None
+        self._data = None
+        self._start = 0
+        self._end = 0
 
-    def __getitem__(self, item):
-        if isinstance(item, tuple):
-            return np.array(getattr(k, item[1]) for k in self.stored_data[item[0]])
+        # number of samples since the last reset, and how many were streamed
+        self.sink = None
+        self._n_total = 0
+        self._n_flushed = 0
+
+    def __len__(self):
+        return self._end - self._start
 
+    def __getitem__(self, item):
+        """ A column by name or a sample, as a namedtuple, by index
+        """
         if isinstance(item, str):
-            return np.array(getattr(k, item[1]) for k in self.stored_data)
+            return self._data[self.header_dict[item], self._start : self._end]
+        if item < 0:
+            item += len(self)
+        if not 0 <= item < len(self):
+            raise IndexError("Accumulator index out of range")
+        return self._tuple_type._make(self._data[1:, self._start + item].tolist())
 
     @property
     def t(self):
-        return np.array(self.times)
+        if self._data is None:
+            return np.zeros(0)
+        return self._data[0, self._start : self._end]
+
+    @property
+    def times(self):
+        return self.t
+
+    def set_fields(self, fields):
+        """ Sets the names of the data columns, the time column excluded,
+        and empties the accumulator
+        """
+        self._tuple_type = namedtuple("t", fields)
+        self._data = np.full(
+            (len(fields) + 1, max(self.initial_length, 1)), np.nan
+        )
+        self._start = 0
+        self._end = 0
+        self._header_dict = None
+        self._n_total = 0
+        self._n_flushed = 0
+        if self.sink is not None:
+            self.sink.reset()
+
+    def _make_room(self, n_new):
+        """ Ensures that n_new samples can be written after the end of the
+        stored data, by moving the data to the beginning of the array or by
+        doubling its size
+        """
+        n_stored = len(self)
+        if self.max_length is not None and n_stored + n_new > self.max_length:
+            n_drop = min(n_stored + n_new - self.max_length, n_stored)
+            self._start += n_drop
+            n_stored -= n_drop
+
+        capacity = self._data.shape[1]
+        if self._end + n_new <= capacity:
+            return
+        # the data is moved only when the array is at most half full,
+        # so that appending is O(1) on average
+        if 2 * (n_stored + n_new) > capacity:
+            new_capacity = max(2 * capacity, 2 * (n_stored + n_new))
+            if self.max_length is not None:
+                new_capacity = min(new_capacity, 2 * self.max_length)
+            new_data = np.full((self._data.shape[0], new_capacity), np.nan)
+            new_data[:, :n_stored] = self._data[:, self._start : self._end]
+            self._data = new_data
+        else:
+            self._data[:, :n_stored] = self._data[:, self._start : self._end]
+        self._start = 0
+        self._end = n_stored
+
+    def append_batch(self, times, values):
+        """ Appends samples
+
+        Parameters
+        ----------
+        times : np.ndarray
+            N times in seconds
+        values : np.ndarray
+            NxJ array of values, J being the number of fields
+
+        """
+        n_new = len(times)
+        if self.max_length is not None and n_new > self.max_length:
+            times = times[-self.max_length :]
+            values = values[-self.max_length :]
+            n_new = self.max_length
+        self._make_room(n_new)
+        self._data[0, self._end : self._end + n_new] = times
+        self._data[1:, self._end : self._end + n_new] = values.T
+        self._end += n_new
+        self._n_total += n_new
+
+    def append(self, t, values):
+        """ Appends a single sample, values being a tuple of the fields """
+        self._make_room(1)
+        self._data[0, self._end] = t
+        self._data[1:, self._end] = values
+        self._end += 1
+        self._n_total += 1
 
     def values_at_abs_time(self, time):
         """ Finds the values in the accumulator closest to the datetime time
@@ -90,15 +257,14 @@ class DataFrameAccumulator(Accumulator):
 
         """
         find_time = (time - self.exp.t0).total_seconds()
-        i = bisect_right(self.times, find_time)
-        return self.stored_data[i - 1]
+        i = np.searchsorted(self.t, find_time, side="right")
+        return self[max(i - 1, 0)]
 
     @property
     def columns(self):
-        try:
-            return ("t",) + self.stored_data[-1]._fields
-        except IndexError:
+        if self._tuple_type is None:
             raise ValueError("Accumulator empty, data types not known")
+        return ("t",) + self._tuple_type._fields
 
     @property
     def header_dict(self):
@@ -124,26 +290,63 @@ class DataFrameAccumulator(Accumulator):
         if monitored_headers is not None:
             self.plot_columns = monitored_headers
 
-        self.stored_data = []
-        self.times = []
-
-        self._header_dict = None
+        self._start = 0
+        self._end = 0
+        self._n_total = 0
+        self._n_flushed = 0
+        if self.sink is not None:
+            self.sink.reset()
 
     def trim_data(self):
-        if (
+        if self.sink is not None:
+            # only the samples already written to the file can be dropped
+            n_keep = max(
+                self.max_history_if_streaming, self._n_total - self._n_flushed
+            )
+            if len(self) > n_keep * 1.5:
+                self._start = self._end - n_keep
+        elif (
             not self.exp.protocol_runner.running
-            and len(self.times) > self.max_history_if_not_running * 1.5
+            and len(self) > self.max_history_if_not_running * 1.5
         ):
-            self.times[: -self.max_history_if_not_running] = []
-            self.stored_data[: -self.max_history_if_not_running] = []
+            self._start = self._end - self.max_history_if_not_running
+
+    def start_streaming(self, sink):
+        """ Starts writing the data to a file while it is accumulated,
+        so that only the last samples need to be kept in memory
+
+        Parameters
+        ----------
+        sink : StreamingLogWriter
+
+        """
+        self.sink = sink
+        # the samples in memory are written at the first flush
+        self._n_flushed = self._n_total - len(self)
+
+    def flush(self):
+        """ Sends the samples accumulated since the last flush to the sink
+        """
+        n_new = min(self._n_total - self._n_flushed, len(self))
+        if self.sink is None or n_new == 0 or self._tuple_type is None:
+            return
+        self.sink.append(
+            self.columns, self._data[:, self._end - n_new : self._end].copy()
+        )
+        self._n_flushed = self._n_total
+
+    def stop_streaming(self):
+        """ Detaches the sink, which is returned """
+        sink = self.sink
+        self.sink = None
+        return sink
 
     def get_fps(self):
         """ """
         try:
-            last_t = self.times[-1]
-            t_minus_dif = self.times[-self.fps_calc_points]
-            return self.fps_calc_points / (last_t - t_minus_dif)
-        except (IndexError, ValueError, ZeroDivisionError, OverflowError):
+            t = self.t
+            return self.fps_calc_points / (t[-1] - t[-self.fps_calc_points])
+        except (IndexError, ValueError, ZeroDivisionError, OverflowError, TypeError):
             return 0.0
 
     def get_last_n(self, n=None):
@@ -157,24 +360,22 @@ class DataFrameAccumulator(Accumulator):
 
         Returns
         -------
-        np.array
-            NxJ Array containing the last n data points, where J is the
-            number of values collected at each timepoint + 1 (the timestamp)
+        AccumulatorWindow
+            view on the last n data points, with the
+            values collected at each timepoint and the timestamp t
 
         """
         if n is not None:
-            last_n = min(n, len(self.stored_data))
+            last_n = min(n, len(self))
         else:
-            last_n = len(self.stored_data)
+            last_n = len(self)
 
-        if last_n == 0:
+        if last_n <= 0:
             return None
 
-        df = pd.DataFrame.from_records(
-            self.stored_data[-last_n:], columns=self.stored_data[-1]._fields
+        return AccumulatorWindow(
+            self._data[:, self._end - last_n : self._end], self.header_dict
         )
-        df["t"] = np.array(self.times[-last_n:])
-        return df
 
     def get_last_t(self, t):
         """
@@ -187,23 +388,26 @@ class DataFrameAccumulator(Accumulator):
 
         Returns
         -------
-        np.array
-            NxJ Array containing the last n data points, where J is the
-            number of values collected at each timepoint + 1 (the timestamp)
-            and N is t*fps
+        AccumulatorWindow
+            view on the data points of the last t seconds
 
 
         """
-        try:
-            n = int(self.get_fps() * t)
-            return self.get_last_n(n)
-        except (OverflowError, ValueError):
-            return self.get_last_n(1)
+        if len(self) == 0:
+            return None
+        times = self.t
+        i_start = np.searchsorted(times, times[-1] - t, side="left")
+        return self.get_last_n(max(len(times) - i_start, 1))
 
     def get_dataframe(self):
         """Returns pandas DataFrame with data and headers.
         """
-        return self.get_last_n(len(self.stored_data))
+        if len(self) == 0:
+            return None
+        data = self._data[:, self._start : self._end]
+        df = pd.DataFrame(data[1:].T.copy(), columns=self.columns[1:])
+        df["t"] = data[0]
+        return df
 
     def save(self, path, format="csv"):
         """ Saves the content of the accumulator in a tabular format.
@@ -219,6 +423,16 @@ class DataFrameAccumulator(Accumulator):
             output format, csv, feather, hdf5, json
 
         """
+        if self.sink is not None:
+            # the data is already in a file, which has only to be completed
+            self.flush()
+            try:
+                return self.stop_streaming().finish(path)
+            except Exception as e:
+                logging.getLogger().info(
+                    "Streaming of the {} log failed, saving the data in "
+                    "memory: {}".format(self.name, e)
+                )
         df = self.get_dataframe()
         if df is None:
             return
@@ -226,32 +440,35 @@ class DataFrameAccumulator(Accumulator):
         return basename(saved_filename)
 
     def is_empty(self):
-        return len(self.stored_data) == 0
+        return len(self) == 0
 
 
 class QueueDataAccumulator(DataFrameAccumulator):
     """General class for retrieving data from a Queue.
 
-    The QueueDataAccumulator takes as input a multiprocessing.Queue object
+    The QueueDataAccumulator takes as input a SharedRecordRing
     and retrieves data from it whenever its :meth:`update_list()
     <QueueDataAccumulator.update_list()>` method is called.
-    All the data are then put in the stored_data list.
+    All the data are then put in the accumulator arrays.
     It is usually connected with a QTimer() timeout to make sure that data
     from the Queue are constantly retrieved.
 
     Parameters
     ----------
-    data_queue : (multiprocessing.Queue object)
-        queue from witch to retrieve data.
+    data_queue : SharedRecordRing
+        ring buffer from which to retrieve data.
     header_list : list of str
         headers for the data to stored.
+    latency_monitor : LatencyMonitor (optional)
+        if given, the latencies from the frame timestamps to the writing
+        of the records and to their reading here are added to it
 
     Returns
     -------
 
     """
 
-    def __init__(self, data_queue, **kwargs):
+    def __init__(self, data_queue, latency_monitor=None, **kwargs):
         """ """
         super().__init__(**kwargs)
 
@@ -259,41 +476,52 @@ class QueueDataAccumulator(DataFrameAccumulator):
         # only time differences in milliseconds in the list (faster)
         self.starting_time = None
         self.data_queue = data_queue
+        self.generation = None
+        self.latency_monitor = latency_monitor
 
     def update_list(self):
-        """Upon calling put all available data into a list.
+        """Upon calling put all available data into the accumulator.
         """
-        while True:
-            try:
-                # Get data from queue:
-                t, data = self.data_queue.get(timeout=0.001)
-                newtype = False
-                if len(self.stored_data) == 0 or type(data) != type(
-                    self.stored_data[-1]
-                ):
-                    self.reset()
-                    newtype = True
-
-                # Time in ms (for having np and not datetime objects)
-                t_s = (t - self.exp.t0).total_seconds()
+        try:
+            # Get all the data written since the last update:
+            times, _, records = self.data_queue.get_batch()
+        except Empty:
+            return
 
-                # append:
-                self.times.append(t_s)
-                self.stored_data.append(data)
+        if self.latency_monitor is not None:
+            write_times = self.data_queue.write_times
+            self.latency_monitor.add("tracking", write_times - times)
+            self.latency_monitor.add("gui", time.time() - times)
+
+        # the generation of the queue changes with the data fields
+        newtype = False
+        if len(self) == 0 or self.generation != self.data_queue.generation:
+            self.reset()
+            if self.generation != self.data_queue.generation:
+                self.set_fields(self.data_queue.tuple_type._fields)
+                self.generation = self.data_queue.generation
+            newtype = True
+
+        if len(records) == 0:
+            return
 
-                self.trim_data()
+        # Time in seconds from the experiment start
+        self.append_batch(
+            times - self.exp.t0.timestamp(), structured_to_unstructured(records)
+        )
+        self.trim_data()
 
-                # if the data type changed, emit a signal
-                if newtype:
-                    self.sig_acc_init.emit()
-            except Empty:
-                break
+        # if the data type changed, emit a signal
+        if newtype:
+            self.sig_acc_init.emit()
 
 
 class FramerateAccumulator(Accumulator):
     def __init__(self, *args, goal_framerate=None, **kwargs):
         super().__init__(*args, **kwargs)
         self.goal_framerate = goal_framerate
+        self.stored_data = []
+        self.times = []
 
     def trim_data(self):
         if len(self.times) > self.max_history_if_not_running * 1.5:
@@ -348,19 +576,11 @@ class DynamicLog(DataFrameAccumulator):
     def __init__(self, stimuli, **kwargs):
         """ """
         self.name = "stimulus_params"
-        self._tupletype = None
         super().__init__(**kwargs)
         # it is assumed the first dynamic stimulus has all the fields
 
         self.update_stimuli(stimuli)
 
-    @property
-    def columns(self):
-        try:
-            return ("t",) + self._tupletype._fields
-        except IndexError:
-            raise ValueError("Data type not set for stimulus log")
-
     def update_list(self, time, data):
         """
 
@@ -373,10 +593,9 @@ class DynamicLog(DataFrameAccumulator):
         -------
 
         """
-        self.times.append(time)
-        self.stored_data.append(
-            self._tupletype(*(data.get(f, np.nan) for f in self._tupletype._fields))
-        )
+        self.append(time, [data.get(f, np.nan) for f in self._tuple_type._fields])
+
+        self.trim_data()
 
     def update_stimuli(self, stimuli):
         dynamic_params = []
@@ -387,17 +606,13 @@ class DynamicLog(DataFrameAccumulator):
                         dynamic_params.append(new_param)
             except AttributeError:
                 pass
-        self._tupletype = namedtuple("s", dynamic_params)
+        self.set_fields(dynamic_params)
         self.reset()
 
 
 class EstimatorLog(DataFrameAccumulator):
     """ """
 
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        self.stored_data = []
-
     def update_list(self, t, data):
         """
 
@@ -410,10 +625,11 @@ class EstimatorLog(DataFrameAccumulator):
         -------
 
         """
-        self.times.append(t)
-        self.stored_data.append(data)
+        if self._tuple_type is None or self._tuple_type._fields != data._fields:
+            self.set_fields(data._fields)
+        self.append(t, data)
 
         self.trim_data()
 
-        if len(self.stored_data) == 1:
+        if len(self) == 1:
             self.sig_acc_init.emit()
@@ -0,0 +1,99 @@
+import numpy as np
+
+
+class LatencyHistogram:
+    """ Histogram of latencies in logarithmically spaced bins, from 0.1 ms
+    to 10 s, from which percentiles can be read without keeping the
+    individual measurements.
+    """
+
+    bin_edges = np.logspace(-4, 1, 101)
+
+    def __init__(self):
+        # the first and the last bin are for values out of the range
+        self.counts = np.zeros(len(self.bin_edges) + 1, np.int64)
+        self.n = 0
+        self.total = 0.0
+        self.max = np.nan
+
+    def reset(self):
+        self.counts[:] = 0
+        self.n = 0
+        self.total = 0.0
+        self.max = np.nan
+
+    def add(self, latencies):
+        """ Adds one latency or an array of them, in seconds. NaNs are ignored
+        """
+        latencies = np.atleast_1d(np.asarray(latencies, np.float64))
+        latencies = latencies[np.isfinite(latencies)]
+        if len(latencies) == 0:
+            return
+        self.counts += np.bincount(
+            np.searchsorted(self.bin_edges, latencies), minlength=len(self.counts)
+        )
+        self.n += len(latencies)
+        self.total += latencies.sum()
+        self.max = np.nanmax([self.max, latencies.max()])
+
+    def percentile(self, q):
+        """ Upper edge of the bin containing the q-th percentile """
+        if self.n == 0:
+            return np.nan
+        i_bin = np.searchsorted(np.cumsum(self.counts), self.n * q / 100)
+        return self.bin_edges[min(i_bin, len(self.bin_edges) - 1)]
+
+    @property
+    def mean(self):
+        return self.total / self.n if self.n > 0 else np.nan
+
+    def summary(self):
+        """ Number of measurements and statistics in milliseconds """
+        return dict(
+            n=int(self.n),
+            mean_ms=self.mean * 1000,
+            p50_ms=self.percentile(50) * 1000,
+            p90_ms=self.percentile(90) * 1000,
+            p99_ms=self.percentile(99) * 1000,
+            max_ms=self.max * 1000,
+        )
+
+
+class LatencyMonitor:
+    """ Latencies of the stages of the closed loop, measured from the
+    timestamp of the camera frame the data comes from:
+
+        - tracking: until the tracking output is available
+        - gui: until the tracking output is read in the GUI process
+        - estimator: until the estimate is published by the tracking process
+        - stimulus: until the stimulus is updated with the estimate
+        - display: until the updated stimulus is painted
+
+    """
+
+    stages = ("tracking", "gui", "estimator", "stimulus", "display")
+
+    def __init__(self):
+        self.histograms = {stage: LatencyHistogram() for stage in self.stages}
+
+    def add(self, stage, latencies):
+        self.histograms[stage].add(latencies)
+
+    def reset(self):
+        for histogram in self.histograms.values():
+            histogram.reset()
+
+    def summary(self):
+        """ Statistics and histograms of the stages with measurements,
+        in a form which can be saved in the metadata
+        """
+        stages = {
+            stage: dict(
+                histogram.summary(), counts=histogram.counts[1:-1].tolist()
+            )
+            for stage, histogram in self.histograms.items()
+            if histogram.n > 0
+        }
+        return dict(
+            stages=stages, bin_edges_ms=(LatencyHistogram.bin_edges * 1000).tolist()
+        )
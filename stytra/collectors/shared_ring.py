@@ -0,0 +1,368 @@
+from multiprocessing import RawArray
+from collections import namedtuple
+from datetime import datetime
+from queue import Empty
+import time
+
+import numpy as np
+
+
+# positions in the shared header
+_GENERATION = 0
+_WRITE_SEQ = 1
+_N_FIELDS = 2
+_CAPACITY = 3
+_NAMES_LENGTH = 4
+_HEADER_LENGTH = 5
+
+# every record starts with the timestamp, the frame index and the time
+# at which it was written
+_N_META = 3
+
+
+class SharedRecordRing:
+    """ Ring buffer in shared memory for streams of namedtuples of numbers,
+    such as the tracking output. It replaces the NamedTupleQueue: nothing is
+    pickled, the writer copies each record in a row of a preallocated float64
+    array and the reader gets all the rows written since its last read as
+    one array.
+
+    The names of the fields are kept in a header, together with the
+    sequence number of the last written record. When the fields change (e.g.
+    if the number of tracked fish is changed) the ring is laid out again
+    and the generation number is increased. Records are never waited for:
+    if the reader is late by more than the capacity of the ring, the
+    oldest records are overwritten and counted as dropped.
+
+    There can be only one writing and one reading process.
+
+    Parameters
+    ----------
+    max_mbytes: float
+        size of the record storage
+    max_header_kbytes: float
+        size of the storage for the field names
+
+    """
+
+    def __init__(self, max_mbytes=10, max_header_kbytes=64):
+        self.max_values = int(max_mbytes * 1000000) // 8
+        self.header = RawArray("q", _HEADER_LENGTH)
+        self.names = RawArray("c", int(max_header_kbytes * 1000))
+        self.values = RawArray("d", self.max_values)
+        self._init_local()
+
+    def _init_local(self):
+        # the numpy views and the position of the reader or writer are
+        # specific to each process
+        self._header = np.frombuffer(self.header, np.int64)
+        self._rows = None
+        self._capacity = 0
+        self._fields = None
+        self._written_type = None
+        self.generation = -1
+        self.read_seq = 0
+        self.n_dropped = 0
+        self.tuple_type = None
+        self.dtype = None
+        self.write_times = None
+        self._pending = []
+
+    def __getstate__(self):
+        return dict(
+            max_values=self.max_values,
+            header=self.header,
+            names=self.names,
+            values=self.values,
+        )
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._init_local()
+
+    def _row_view(self, n_fields, capacity):
+        return np.frombuffer(
+            self.values, np.float64, capacity * (n_fields + _N_META)
+        ).reshape(capacity, n_fields + _N_META)
+
+    def _set_fields(self, fields):
+        names = "\n".join(fields).encode()
+        if len(names) > len(self.names):
+            raise ValueError(
+                "The field names do not fit in the {} bytes of the header".format(
+                    len(self.names)
+                )
+            )
+        n_fields = len(fields)
+        capacity = self.max_values // (n_fields + _N_META)
+
+        # the generation is odd while the layout is being changed
+        self._header[_GENERATION] += 1
+        self.names[: len(names)] = names
+        self._header[_NAMES_LENGTH] = len(names)
+        self._header[_N_FIELDS] = n_fields
+        self._header[_CAPACITY] = capacity
+        self._header[_WRITE_SEQ] = 0
+        self._header[_GENERATION] += 1
+
+        self._fields = tuple(fields)
+        self._capacity = capacity
+        self._rows = self._row_view(n_fields, capacity)
+
+    def put(self, t, obj, index=-1):
+        """ Writes a record
+
+        Parameters
+        ----------
+        t: datetime
+            time of the record
+        obj: namedtuple
+            the record, all fields have to be numbers
+        index: int
+            frame index associated with the record
+
+        """
+        if type(obj) is not self._written_type:
+            self._written_type = type(obj)
+            if obj._fields != self._fields:
+                self._set_fields(obj._fields)
+        seq = int(self._header[_WRITE_SEQ])
+        row = self._rows[seq % self._capacity]
+        row[0] = t.timestamp()
+        row[1] = index
+        row[_N_META:] = obj
+        row[2] = time.time()
+        self._header[_WRITE_SEQ] = seq + 1
+
+    def _read_fields(self):
+        """ Loads the layout of the current generation, returns False if
+        it is being changed
+        """
+        generation = int(self._header[_GENERATION])
+        if generation % 2 == 1:
+            return False
+        n_fields = int(self._header[_N_FIELDS])
+        names = self.names[: int(self._header[_NAMES_LENGTH])].decode()
+        capacity = int(self._header[_CAPACITY])
+        if self._header[_GENERATION] != generation:
+            return False
+
+        self._fields = tuple(names.split("\n")) if n_fields > 0 else ()
+        self._capacity = capacity
+        self._rows = self._row_view(n_fields, capacity)
+        self.tuple_type = namedtuple("t", self._fields)
+        self.dtype = np.dtype(
+            dict(
+                names=self._fields,
+                formats=[np.float64] * n_fields,
+                offsets=[8 * (i + _N_META) for i in range(n_fields)],
+                itemsize=8 * (n_fields + _N_META),
+            )
+        )
+        self.generation = generation
+        self.read_seq = 0
+        return True
+
+    def get_batch(self):
+        """ Reads all the records written since the last call
+
+        Returns
+        -------
+        times: np.ndarray
+            timestamps of the records, in seconds since the epoch
+        indices: np.ndarray
+            frame indices of the records
+        records: np.ndarray
+            structured array with the records, the field names are in
+            self.tuple_type._fields
+
+        The times at which the records were written are kept in
+        self.write_times.
+
+        Raises
+        ------
+        Empty
+            if there are no new records. If the fields have changed, the
+            records of the previous generation that were not read are discarded
+
+        """
+        generation = self._header[_GENERATION]
+        if generation != self.generation and not self._read_fields():
+            raise Empty()
+
+        write_seq = int(self._header[_WRITE_SEQ])
+        if write_seq == self.read_seq:
+            raise Empty()
+
+        if write_seq - self.read_seq > self._capacity:
+            self.n_dropped += write_seq - self.read_seq - self._capacity
+            self.read_seq = write_seq - self._capacity
+
+        i_start = self.read_seq % self._capacity
+        i_end = write_seq % self._capacity
+        if i_start < i_end:
+            block = self._rows[i_start:i_end].copy()
+        else:
+            block = np.concatenate([self._rows[i_start:], self._rows[:i_end]])
+
+        # the layout might have changed while copying
+        if self._header[_GENERATION] != self.generation:
+            raise Empty()
+
+        # the oldest rows might have been overwritten while copying
+        n_overwritten = (
+            int(self._header[_WRITE_SEQ]) + 1 - self._capacity - self.read_seq
+        )
+        if n_overwritten > 0:
+            block = block[n_overwritten:]
+            self.n_dropped += n_overwritten
+        self.read_seq = write_seq
+        self.write_times = block[:, 2]
+
+        return (
+            block[:, 0],
+            block[:, 1].astype(np.int64),
+            block.view(self.dtype)[:, 0],
+        )
+
+    def get(self, block=True, timeout=None):
+        """ Reads the records as (time, namedtuple), one by one. Slower than
+        get_batch, mostly for compatibility with the NamedTupleQueue
+        """
+        if not self._pending:
+            t_limit = None if timeout is None else datetime.now().timestamp() + timeout
+            while True:
+                try:
+                    times, _, records = self.get_batch()
+                    break
+                except Empty:
+                    if not block or (
+                        t_limit is not None and datetime.now().timestamp() > t_limit
+                    ):
+                        raise
+            self._pending = [
+                (datetime.fromtimestamp(t), self.tuple_type._make(r))
+                for t, r in zip(times.tolist(), records.tolist())
+            ][::-1]
+        return self._pending.pop()
+
+
+class SharedLatestRecords:
+    """ The last records of a stream with fixed fields, kept in shared memory
+    for a reader which needs the latest values, or the values a given number
+    of records before, without consuming a queue. It is used to pass the
+    closed-loop estimates from the tracking process to the stimulus.
+
+    Each record keeps the time of the frame it was computed from and the
+    time at which it was written. The writer never waits: a reader
+    retries if the record it copies is overwritten in the meantime.
+
+    There can be only one writing process.
+
+    Parameters
+    ----------
+    fields: tuple of str
+        names of the values of a record
+    n_keep: int
+        number of records kept
+
+    """
+
+    def __init__(self, fields, n_keep=1024):
+        self.fields = tuple(fields)
+        self.n_keep = n_keep
+        self.header = RawArray("q", 1)
+        # every row is: sequence number, frame time, write time, values
+        self.values = RawArray("d", n_keep * (len(self.fields) + 3))
+        self._init_local()
+
+    def _init_local(self):
+        self._header = np.frombuffer(self.header, np.int64)
+        self._rows = np.frombuffer(self.values, np.float64).reshape(
+            self.n_keep, len(self.fields) + 3
+        )
+        self.tuple_type = namedtuple("e", self.fields)
+
+    def __getstate__(self):
+        return dict(
+            fields=self.fields,
+            n_keep=self.n_keep,
+            header=self.header,
+            values=self.values,
+        )
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._init_local()
+
+    @property
+    def n_written(self):
+        return int(self._header[0])
+
+    def put(self, t, values):
+        """ Writes a record
+
+        Parameters
+        ----------
+        t: float
+            timestamp of the frame the values were computed from
+        values: tuple
+            the values, in the order of the fields
+
+        """
+        seq = int(self._header[0])
+        row = self._rows[seq % self.n_keep]
+        row[0] = -1
+        row[1] = t
+        row[3:] = values
+        row[2] = time.time()
+        row[0] = seq
+        self._header[0] = seq + 1
+
+    def get(self, n_back=0):
+        """ Reads the latest record, or the one n_back records before it
+
+        Returns
+        -------
+        (frame time, write time, namedtuple of values) or None if the
+        record is not available
+
+        """
+        n_back = min(n_back, self.n_keep - 2)
+        for _ in range(3):
+            seq = int(self._header[0]) - 1 - n_back
+            if seq < 0:
+                return None
+            row = self._rows[seq % self.n_keep].copy()
+            if row[0] == seq:
+                return row[1], row[2], self.tuple_type._make(row[3:].tolist())
+        return None
+
+    def get_times_since(self, seq):
+        """ Frame and write times of the records written from the sequence
+        number seq on, as far as they are still kept
+
+        Returns
+        -------
+        frame times, write times, sequence number of the next record
+
+        """
+        n_written = self.n_written
+        seqs = np.arange(max(seq, n_written - self.n_keep + 1), n_written)
+        rows = self._rows[seqs % self.n_keep]
+        valid = rows[:, 0] == seqs
+        return rows[valid, 1], rows[valid, 2], n_written
+
+    def n_back_for(self, lag, n_average=64):
+        """ Number of records written in the last lag seconds, estimated
+        from the frame times of the last n_average records
+        """
+        if lag <= 0:
+            return 0
+        n_average = min(n_average, self.n_written - 1, self.n_keep - 2)
+        if n_average < 1:
+            return 0
+        latest, first = self.get(0), self.get(n_average)
+        if latest is None or first is None or latest[0] <= first[0]:
+            return 0
+        return int(round(lag * n_average / (latest[0] - first[0])))
@@ -0,0 +1,173 @@
+import os
+from pathlib import Path
+from queue import Queue
+from threading import Thread
+
+import pandas as pd
+
+
+class _CsvAppender:
+    def __init__(self, path):
+        self.file = open(str(path), "w")
+        self.header = True
+
+    def append(self, df):
+        # replace True and False in csv files, as in save_df:
+        df.replace({True: 1, False: 0}).to_csv(self.file, sep=";", header=self.header)
+        self.header = False
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+class _HdfAppender:
+    def __init__(self, path):
+        self.store = pd.HDFStore(str(path), mode="w", complib="blosc", complevel=5)
+
+    def append(self, df):
+        self.store.append("data", df, index=False)
+        self.store.flush()
+
+    def close(self):
+        self.store.close()
+
+
+class _FeatherAppender:
+    """ Writes a feather (Arrow IPC file) batch by batch """
+
+    def __init__(self, path):
+        import pyarrow
+
+        self.pa = pyarrow
+        self.path = str(path)
+        self.writer = None
+
+    def append(self, df):
+        table = self.pa.Table.from_pandas(df, preserve_index=False)
+        if self.writer is None:
+            self.writer = self.pa.ipc.new_file(self.path, table.schema)
+        self.writer.write_table(table)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+
+class StreamingLogWriter(Thread):
+    """ Appends the data of an accumulator to a log file during the
+    experiment, so that the data is on disk if the experiment crashes and
+    does not need to be kept in memory.
+
+    Chunks of data are passed with :meth:`append` and written by this
+    thread in a temporary file, which is moved to the final
+    file name by :meth:`finish`.
+
+    Parameters
+    ----------
+    path : str
+        output path, without extension name
+    fileformat : str
+        output format, one of the STREAMABLE_FORMATS
+
+    """
+
+    STREAMABLE_FORMATS = dict(
+        csv=_CsvAppender, hdf5=_HdfAppender, feather=_FeatherAppender
+    )
+
+    def __init__(self, path, fileformat):
+        super().__init__(daemon=True)
+        if fileformat not in self.STREAMABLE_FORMATS:
+            raise NotImplementedError(fileformat + " logs can not be streamed")
+        self.fileformat = fileformat
+        self.partial_path = Path(str(path) + "." + fileformat + ".partial")
+        self.queue = Queue()
+        self.n_written = 0
+        self.saved_filename = None
+        self.error = None
+
+    def append(self, columns, data):
+        """ Queues a chunk of data for writing
+
+        Parameters
+        ----------
+        columns : tuple of str
+            names of the columns, the first is the time
+        data : np.ndarray
+            JxN array, one row per column
+
+        """
+        self.queue.put(("append", columns, data))
+
+    def reset(self):
+        """ Discards the data written so far """
+        self.queue.put(("reset",))
+
+    def finish(self, path):
+        """ Writes the remaining data and moves the log to its final
+        path, without extension name
+
+        Returns
+        -------
+        the name of the saved file
+
+        """
+        self.queue.put(("finish", Path(str(path) + "." + self.fileformat)))
+        self.join()
+        if self.error is not None:
+            raise self.error
+        return self.saved_filename
+
+    def abort(self):
+        """ Stops writing and deletes the temporary file """
+        self.queue.put(("abort",))
+        self.join()
+
+    def run(self):
+        appender = None
+        while True:
+            command, *args = self.queue.get()
+            try:
+                if command == "append":
+                    if self.error is not None:
+                        continue
+                    columns, data = args
+                    if appender is None:
+                        appender = self.STREAMABLE_FORMATS[self.fileformat](
+                            self.partial_path
+                        )
+                    # columns ordered as in the saved accumulator dataframes
+                    df = pd.DataFrame(
+                        data[1:].T,
+                        columns=columns[1:],
+                        index=pd.RangeIndex(
+                            self.n_written, self.n_written + data.shape[1]
+                        ),
+                    )
+                    df["t"] = data[0]
+                    appender.append(df)
+                    self.n_written += data.shape[1]
+                    continue
+                if appender is not None:
+                    appender.close()
+                    appender = None
+                self.n_written = 0
+                if command == "reset":
+                    self.error = None
+                    if self.partial_path.exists():
+                        os.remove(str(self.partial_path))
+                elif command == "finish":
+                    if self.partial_path.exists():
+                        os.replace(str(self.partial_path), str(args[0]))
+                        self.saved_filename = args[0].name
+                    return
+                elif command == "abort":
+                    if self.partial_path.exists():
+                        os.remove(str(self.partial_path))
+                    return
+            except Exception as e:
+                # the error is raised when finishing, no more data is written
+                self.error = e
+                if command in ("finish", "abort"):
+                    return
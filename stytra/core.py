@@ -125,7 +125,11 @@ class Stytra:
 
         n_tracking_processes : int
             number of tracking processes to be used. Using more than 1 can improve performance
-            but also cause issues in state-dependent tracking functions.
+            for expensive pipelines. Frames are distributed between the processes and
+            the results are put back in order. Pipeline nodes that depend on the
+            previous frames declare how they are handled by their parallel_policy,
+            pipelines that need all frames in order (e.g. freely-swimming fish tracking)
+            always use one process.
 
         arduino_config : dict
             Dictionary describing the configuration of an Arduino board.
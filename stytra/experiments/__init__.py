@@ -17,6 +17,8 @@ from PyQt5.QtWidgets import QMessageBox
 
 from stytra.calibration import CrossCalibrator
 from stytra.collectors import DataCollector
+from stytra.collectors.streaming import StreamingLogWriter
+from stytra.collectors.latency import LatencyMonitor
 from stytra.stimulation import ProtocolRunner
 from stytra.metadata import AnimalMetadata, GeneralMetadata
 from stytra.stimulation.stimulus_display import StimulusDisplayWindow
@@ -85,6 +87,10 @@ class Experiment(QObject):
         if stytra is used in offline analysis, stimulus is not displayed
     log_format : str
         one of "csv", "feather", "hdf5" (pytables-based) or "json"
+    log_flush_interval : float
+        interval in seconds at which the logs are written to disk during the
+        protocol. If None, or if the log format is json, they are
+        saved only at the end of the protocol
     """
 
     sig_data_saved = pyqtSignal()
@@ -102,6 +108,7 @@ class Experiment(QObject):
         loop_protocol=False,
         arduino_config=None,
         log_format="csv",
+        log_flush_interval=5.0,
         trigger_duration_queue=None,
         scope_triggering=None,
         offline=False,
@@ -130,6 +137,7 @@ class Experiment(QObject):
         self.database = database
         self.use_db = True if database else False
         self.log_format = log_format
+        self.log_flush_interval = log_flush_interval
         self.loop_protocol = loop_protocol
 
         self.dc = DataCollector(
@@ -164,6 +172,9 @@ class Experiment(QObject):
 
         self.dc.add(self.protocol)
 
+        # latencies of the closed loop, from the camera frame to the display
+        self.latency_monitor = LatencyMonitor()
+
         self.protocol_runner = ProtocolRunner(experiment=self)
 
         # assign signals from protocol_runner to be used externally:
@@ -178,6 +189,10 @@ class Experiment(QObject):
         self.gui_timer = QTimer()
         self.gui_timer.setSingleShot(False)
 
+        self.log_flush_timer = QTimer()
+        self.log_flush_timer.setSingleShot(False)
+        self.log_flush_timer.timeout.connect(self.flush_logs)
+
         self.t0 = datetime.datetime.now()
 
         self.animal_id = None
@@ -204,6 +219,44 @@ class Experiment(QObject):
 
         self.dc.add_static_data(logname, category + "/" + name)
 
+    def streamed_logs(self):
+        """ The logs which are written to disk during the protocol,
+        as (log, name) pairs
+        """
+        if self.protocol_runner.dynamic_log is not None:
+            return [(self.protocol_runner.dynamic_log, "stimulus_log")]
+        return []
+
+    def start_log_streaming(self):
+        """ Starts writing the logs to temporary files, completed when
+        the logs are saved
+        """
+        if (
+            not self.log_flush_interval
+            or self.log_format not in StreamingLogWriter.STREAMABLE_FORMATS
+            or self.session_id is None
+        ):
+            return
+        for log, name in self.streamed_logs():
+            writer = StreamingLogWriter(self.filename_base() + name, self.log_format)
+            writer.start()
+            log.start_streaming(writer)
+        self.log_flush_timer.start(int(self.log_flush_interval * 1000))
+
+    def flush_logs(self):
+        for log, _ in self.streamed_logs():
+            log.flush()
+
+    def stop_log_streaming(self):
+        """ Stops writing the logs which have not been saved, and deletes
+        their files
+        """
+        self.log_flush_timer.stop()
+        for log, _ in self.streamed_logs():
+            sink = log.stop_streaming()
+            if sink is not None:
+                sink.abort()
+
     def initialize_plots(self):
         pass
 
@@ -221,6 +274,7 @@ class Experiment(QObject):
             self.protocol_runner.dynamic_log.reset()
 
         self.protocol_runner.framerate_acc.reset()
+        self.latency_monitor.reset()
 
     def start_experiment(self):
         """Start the experiment creating GUI and initialising metadata.
@@ -325,6 +379,7 @@ class Experiment(QObject):
         self.check_trigger()
         self.reset()
         self.protocol_runner.start()
+        self.start_log_streaming()
         self.read_scope_data()
 
     def abort_start(self):
@@ -343,6 +398,9 @@ class Experiment(QObject):
                 )
                 self.dc.add_static_data(self.animal_id, name="general/fish_id")
                 self.dc.add_static_data(self.session_id, name="general/session_id")
+                self.dc.add_static_data(
+                    self.latency_monitor.summary(), name="general/latency"
+                )
 
                 if self.database is not None and self.use_db:
                     db_id = self.database.insert_experiment_data(
@@ -415,9 +473,11 @@ class Experiment(QObject):
 
         self.protocol_runner.stop()
         self.set_id()
+        self.log_flush_timer.stop()
 
         if save:
             self.save_data()
+        self.stop_log_streaming()
 
         self.i_run += 1
         self.current_timestamp = datetime.datetime.now()
@@ -1,6 +1,6 @@
 from stytra.tracking.pipelines import Pipeline
 from stytra.tracking.preprocessing import Prefilter, BackgroundSubtractor
-from stytra.tracking.tail import CentroidTrackingMethod
+from stytra.tracking.tail import CentroidTrackingMethod, MultiTailTrackingMethod
 from stytra.tracking.fish import FishTrackingMethod
 from stytra.tracking.eyes import EyeTrackingMethod
 from stytra.gui.fishplots import TailStreamPlot, BoutPlot
@@ -21,6 +21,14 @@ class TailTrackingPipeline(Pipeline):
         self.display_overlay = TailTrackingSelection
 
 
+class MultiTailTrackingPipeline(Pipeline):
+    def __init__(self):
+        super().__init__()
+        self.filter = Prefilter(parent=self.root)
+        self.tailtrack = MultiTailTrackingMethod(parent=self.filter)
+        self.display_overlay = TailTrackingSelection
+
+
 class FishTrackingPipeline(Pipeline):
     def __init__(self):
         super().__init__()
@@ -50,6 +58,7 @@ class EyeTailTrackingPipeline(Pipeline):
 
 pipeline_dict = dict(
     tail=TailTrackingPipeline,
+    multi_tail=MultiTailTrackingPipeline,
     fish=FishTrackingPipeline,
     eyes=EyeTrackingPipeline,
     eyes_tail=EyeTailTrackingPipeline,
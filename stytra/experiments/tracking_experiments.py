@@ -21,9 +21,9 @@ from stytra.collectors import (
     EstimatorLog,
     FramerateQueueAccumulator,
 )
-from stytra.tracking.tracking_process import TrackingProcess
+from stytra.tracking.tracking_process import TrackingProcess, TrackingReorderProcess
 from stytra.tracking.pipelines import Pipeline
-from stytra.collectors.namedtuplequeue import NamedTupleQueue
+from stytra.collectors.shared_ring import SharedRecordRing
 from stytra.experiments.fish_pipelines import pipeline_dict
 
 from stytra.stimulation.estimators import estimator_dict
@@ -185,13 +185,20 @@ class TrackingExperiment(CameraVisualExperiment):
             containing fields:  tracking_method
                                 estimator: can be vigor for embedded fish, position
                                     for freely-swimming, or a custom subclass of Estimator
+        n_tracking_processes: int
+            number of tracking worker processes. Frames are distributed between
+            the workers and the results are put back in order by a
+            reordering process. Pipelines containing pinned nodes and
+            experiments recording video use a single process.
 
     Returns
     -------
 
     """
 
-    def __init__(self, *args, tracking, recording=None, **kwargs):
+    def __init__(
+        self, *args, tracking, recording=None, n_tracking_processes=1, **kwargs
+    ):
         """
         :param tracking_method: class with the parameters for tracking (instance
                                 of TrackingMethod class, defined in the child);
@@ -202,7 +209,7 @@ class TrackingExperiment(CameraVisualExperiment):
         """
 
         self.processing_params_queue = Queue()
-        self.tracking_output_queue = NamedTupleQueue()
+        self.tracking_output_queue = SharedRecordRing()
         self.finished_sig = Event()
         super().__init__(*args, **kwargs)
         self.arguments.update(locals())
@@ -216,20 +223,21 @@ class TrackingExperiment(CameraVisualExperiment):
             if isinstance(tracking["method"], str)
             else tracking["method"]
         )
-
-        self.frame_dispatcher = TrackingProcess(
-            in_frame_queue=self.camera.frame_queue,
-            finished_signal=self.camera.kill_event,
-            pipeline=self.pipeline_cls,
-            processing_parameter_queue=self.processing_params_queue,
-            output_queue=self.tracking_output_queue,
-            recording_signal=self.recording_event,
-            gui_framerate=20,
-        )
         if self.pipeline_cls is None:
             raise NameError("The selected tracking method does not exist!")
         self.pipeline = self.pipeline_cls()
         assert isinstance(self.pipeline, Pipeline)
+
+        if n_tracking_processes > 1 and self.pipeline.parallel_policy == "pinned":
+            self.logger.info(
+                "The tracking pipeline has to see all frames in order, "
+                "using a single tracking process"
+            )
+            n_tracking_processes = 1
+        if n_tracking_processes > 1 and self.recording_event is not None:
+            self.logger.info("Video recording requires a single tracking process")
+            n_tracking_processes = 1
+
         self.pipeline.setup(tree=self.dc)
 
         self.acc_tracking = QueueDataAccumulator(
@@ -237,6 +245,7 @@ class TrackingExperiment(CameraVisualExperiment):
             experiment=self,
             data_queue=self.tracking_output_queue,
             monitored_headers=self.pipeline.headers_to_plot,
+            latency_monitor=self.latency_monitor,
         )
         self.acc_tracking.sig_acc_init.connect(self.refresh_plots)
 
@@ -246,9 +255,6 @@ class TrackingExperiment(CameraVisualExperiment):
         # Tracking is reset at experiment start:
         self.protocol_runner.sig_protocol_started.connect(self.acc_tracking.reset)
 
-        # start frame dispatcher process:
-        self.frame_dispatcher.start()
-
         est_type = tracking.get("estimator", None)
         if est_type is None:
             est = None
@@ -268,9 +274,71 @@ class TrackingExperiment(CameraVisualExperiment):
         else:
             self.estimator = None
 
+        # the latencies of all the estimates are read with the GUI timer
+        self.estimate_seq = 0
+        self.gui_timer.timeout.connect(self.record_estimator_latency)
+
+        # the estimates are computed by the last tracking stage, where the
+        # outputs are in frame order
+        online_estimator = getattr(self.estimator, "online", None)
+
+        self.processing_params_queues = [self.processing_params_queue]
+        self.camera.n_consumers = n_tracking_processes
+
+        if n_tracking_processes == 1:
+            self.tracking_workers = [
+                TrackingProcess(
+                    in_frame_queue=self.camera.frame_queue,
+                    finished_signal=self.camera.kill_event,
+                    pipeline=self.pipeline_cls,
+                    processing_parameter_queue=self.processing_params_queue,
+                    output_queue=self.tracking_output_queue,
+                    recording_signal=self.recording_event,
+                    gui_framerate=20,
+                    estimator=online_estimator,
+                )
+            ]
+            self.tracking_reorder = None
+        else:
+            # every worker, and the reordering process, need the parameters
+            self.processing_params_queues += [
+                Queue() for _ in range(n_tracking_processes)
+            ]
+            self.tracking_workers = [
+                TrackingProcess(
+                    in_frame_queue=self.camera.frame_queue,
+                    finished_signal=self.camera.kill_event,
+                    pipeline=self.pipeline_cls,
+                    processing_parameter_queue=self.processing_params_queues[i + 1],
+                    output_queue=SharedRecordRing(),
+                    gui_framerate=20,
+                    worker_index=i,
+                )
+                for i in range(n_tracking_processes)
+            ]
+            self.tracking_reorder = TrackingReorderProcess(
+                worker_queues=[w.output_queue for w in self.tracking_workers],
+                output_queue=self.tracking_output_queue,
+                finished_signal=self.camera.kill_event,
+                pipeline=self.pipeline_cls,
+                processing_parameter_queue=self.processing_params_queue,
+                estimator=online_estimator,
+            )
+
+        # the first worker sends the frames to the GUI
+        self.frame_dispatcher = self.tracking_workers[0]
+        self.tracking_processes = self.tracking_workers + (
+            [self.tracking_reorder] if self.tracking_reorder is not None else []
+        )
+
+        # start tracking processes:
+        for process in self.tracking_processes:
+            process.start()
+
         self.acc_tracking_framerate = FramerateQueueAccumulator(
             self,
-            queue=self.frame_dispatcher.framerate_queue,
+            # the last process is the reordering one for parallel tracking
+            queue=self.tracking_processes[-1].framerate_queue,
             name="tracking",
             goal_framerate=kwargs["camera"].get("min_framerate", None),
         )
@@ -303,6 +371,20 @@ class TrackingExperiment(CameraVisualExperiment):
         if self.estimator is not None:
             self.estimator.reset()
             self.estimator_log.reset()
+        online = getattr(self.estimator, "online", None)
+        if online is not None:
+            self.estimate_seq = online.output.n_written
+
+    def record_estimator_latency(self):
+        """ Adds the latencies of the estimates published since the last call
+        """
+        online = getattr(self.estimator, "online", None)
+        if online is None:
+            return
+        frame_times, write_times, self.estimate_seq = online.output.get_times_since(
+            self.estimate_seq
+        )
+        self.latency_monitor.add("estimator", write_times - frame_times)
 
     def make_window(self):
         self.window_main = TrackingExperimentWindow(experiment=self)
@@ -339,7 +421,9 @@ class TrackingExperiment(CameraVisualExperiment):
 
         """
         super().send_gui_parameters()
-        self.processing_params_queue.put(self.pipeline.serialize_changed_params())
+        changed_params = self.pipeline.serialize_changed_params()
+        for queue in self.processing_params_queues:
+            queue.put(changed_params)
 
     def start_protocol(self):
         # Freeze the plots so the plotting does not interfere with
@@ -387,6 +471,12 @@ class TrackingExperiment(CameraVisualExperiment):
 
         super().save_data()
 
+    def streamed_logs(self):
+        logs = super().streamed_logs() + [(self.acc_tracking, "behavior_log")]
+        if self.estimator is not None:
+            logs.append((self.estimator.log, "estimator_log"))
+        return logs
+
     def set_protocol(self, protocol):
         """Connect new protocol start to resetting of the data accumulator.
 
@@ -425,7 +515,8 @@ class TrackingExperiment(CameraVisualExperiment):
 
         self.frame_dispatcher.gui_queue.clear()
 
-        self.frame_dispatcher.join()
+        for process in self.tracking_processes:
+            process.join()
 
     def excepthook(self, exctype, value, tb):
         """ If an exception happens in the main loop, close all the
@@ -436,4 +527,5 @@ class TrackingExperiment(CameraVisualExperiment):
         print("{0}: {1}".format(exctype, value))
         self.finished_sig.set()
         self.camera.join()
-        self.frame_dispatcher.join()
+        for process in self.tracking_processes:
+            process.join()
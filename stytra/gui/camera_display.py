@@ -3,7 +3,7 @@ from queue import Empty
 
 import numpy as np
 import pyqtgraph as pg
-from PyQt5.QtCore import QRectF, QPointF, QTimer
+from PyQt5.QtCore import QRectF, QPointF, QTimer, Qt
 from PyQt5.QtWidgets import QWidget, QVBoxLayout, QHBoxLayout
 
 from skimage.io import imsave
@@ -12,6 +12,7 @@ from math import sin, cos
 from lightparam.gui import ParameterGui, ControlToggleIcon
 
 from stytra.gui.buttons import IconButton, ToggleIconButton, get_icon
+from stytra.tracking.tail import MultiTailTrackingMethod, tail_grid
 
 
 class SingleLineROI(pg.LineSegmentROI):
@@ -292,12 +293,34 @@ class TailTrackingSelection(CameraSelection):
         )
 
         # Prepare curve for plotting tracked tail position:
-        self.curve_tail = pg.PlotCurveItem(pen=dict(color=(230, 40, 5), width=3))
+        self.curve_tail = pg.PlotCurveItem(
+            pen=dict(color=(230, 40, 5), width=3), connect="finite"
+        )
         self.display_area.addItem(self.curve_tail)
 
+        # With several wells, the ROI sets the tail of the first one and a
+        # line from it to the start of the tail in the last well
+        # sets the grid, on which the tails of all the wells are shown
+        self.multi_well = isinstance(
+            self.experiment.pipeline.tailtrack, MultiTailTrackingMethod
+        )
+        if self.multi_well:
+            self.roi_grid = SingleLineROI(
+                self.grid_points(),
+                pen=dict(color=(40, 5, 200), width=1, style=Qt.DashLine),
+            )
+            self.curve_wells = pg.PlotCurveItem(
+                pen=dict(color=(40, 5, 200), width=1), connect="pairs"
+            )
+            self.display_area.addItem(self.curve_wells)
+
         self.initialise_roi(self.roi_tail)
+        if self.multi_well:
+            self.initialise_roi(self.roi_grid)
 
         self.setting_param_val = False
+        if self.multi_well:
+            self.show_wells()
 
     def set_pos_from_tree(self):
         """Go to parent for definition."""
@@ -308,10 +331,18 @@ class TailTrackingSelection(CameraSelection):
             np1, np2 = self.tail_points()
             p1.setPos(QPointF(*np1))
             p2.setPos(QPointF(*np2))
+            if self.multi_well:
+                self.setting_param_val = True
+                for handle, point in zip(self.roi_grid.getHandles(), self.grid_points()):
+                    handle.setPos(QPointF(*point))
+                self.setting_param_val = False
+                self.show_wells()
 
     def set_pos_from_roi(self):
         """Go to parent for definition."""
         super().set_pos_from_roi()
+        if self.setting_param_val:
+            return
 
         self.setting_param_val = True
 
@@ -324,6 +355,14 @@ class TailTrackingSelection(CameraSelection):
         )
         self.tail_params.params.tail_length.changed = True
 
+        if self.multi_well:
+            _, p_end = self.roi_grid.getHandles()
+            self.tail_params.grid_end = (p_end.y() / self.scale, p_end.x() / self.scale)
+            self.tail_params.params.grid_end.changed = True
+            # the grid line starts from the tail of the first well
+            self.roi_grid.getHandles()[0].setPos(p1.pos())
+            self.show_wells()
+
         self.setting_param_val = False
 
     def scale_changed(self):
@@ -337,13 +376,17 @@ class TailTrackingSelection(CameraSelection):
             return
 
         # Get data from queue(first is timestamp)
-        if len(self.experiment.acc_tracking.stored_data) > 1:
+        if len(self.experiment.acc_tracking) > 1:
             # To match tracked points and frame displayed looks for matching
             # timestamps from the two different queues:
             retrieved_data = self.experiment.acc_tracking.values_at_abs_time(
                 self.current_frame_time
             )
             # Check for data to be displayed:
+            if self.multi_well:
+                self.show_tracked_wells(retrieved_data)
+                return
+
             # Retrieve tail angles from tail
 
             angles = [
@@ -367,6 +410,60 @@ class TailTrackingSelection(CameraSelection):
             points = np.array(points)
             self.curve_tail.setData(x=points[:, 1], y=points[:, 0])
 
+    def show_tracked_wells(self, retrieved_data):
+        """ Draws the tracked tails of all the wells as one curve, separated
+        by NaNs
+        """
+        n_segments = self.tail_params.n_output_segments
+        try:
+            angles = np.array(
+                [
+                    [
+                        getattr(retrieved_data, "f{:d}_theta_{:02d}".format(i_fish, i))
+                        for i in range(n_segments)
+                    ]
+                    for i_fish in range(len(self.well_starts()))
+                ]
+            )
+        except AttributeError:  # the grid is being changed
+            return
+        (tly, tlx) = (t * self.scale for t in self.tail_params.tail_length)
+        segment_length = np.sqrt(tlx ** 2 + tly ** 2) / n_segments
+        steps = segment_length * np.stack([np.cos(angles), np.sin(angles)], -1)
+        points = np.concatenate(
+            [
+                self.well_starts()[:, None, :],
+                self.well_starts()[:, None, :] + np.cumsum(steps, 1),
+                np.full((len(angles), 1, 2), np.nan),
+            ],
+            1,
+        ).reshape(-1, 2)
+        self.curve_tail.setData(x=points[:, 1], y=points[:, 0])
+
+    def well_starts(self):
+        """ Tail starts of the wells in (y, x) image coordinates """
+        return (
+            tail_grid(
+                self.tail_params.tail_start,
+                self.tail_params.grid_end,
+                self.tail_params.n_rows,
+                self.tail_params.n_columns,
+            )
+            * self.scale
+        )
+
+    def show_wells(self):
+        """ Draws the tails of the grid defined by the parameters """
+        starts = self.well_starts()
+        ends = starts + np.array(self.tail_params.tail_length) * self.scale
+        points = np.stack([starts, ends], 1).reshape(-1, 2)
+        self.curve_wells.setData(x=points[:, 1], y=points[:, 0])
+
+    def grid_points(self):
+        tsy, tsx = (t * self.scale for t in self.tail_params.tail_start)
+        gey, gex = (t * self.scale for t in self.tail_params.grid_end)
+        return (tsx, tsy), (gex, gey)
+
     def tail_points(self):
         tsy, tsx = (t * self.scale for t in self.tail_params.tail_start)
         tly, tlx = (t * self.scale for t in self.tail_params.tail_length)
@@ -439,7 +536,7 @@ class EyeTrackingSelection(CameraSelection):
             return
 
         # Get data from queue(first is timestamp)
-        if len(self.experiment.acc_tracking.stored_data) > 1:
+        if len(self.experiment.acc_tracking) > 1:
             # To match tracked points and frame displayed looks for matching
             # timestamps from the two different queues:
             retrieved_data = self.experiment.acc_tracking.values_at_abs_time(
@@ -447,7 +544,7 @@ class EyeTrackingSelection(CameraSelection):
             )
             # Check for data to be displayed:
 
-            if len(self.experiment.acc_tracking.stored_data) > 1:
+            if len(self.experiment.acc_tracking) > 1:
                 self.roi_eyes.setPen(dict(color=(5, 40, 200), width=3))
                 checkifnan = getattr(retrieved_data, "th_e0")
                 for i, o in enumerate([0, 5]):
@@ -617,7 +714,7 @@ class CameraViewFish(CameraViewCalib):
         super().retrieve_image()
 
         if (
-            len(self.experiment.acc_tracking.stored_data) == 0
+            len(self.experiment.acc_tracking) == 0
             or self.current_image is None
         ):
             return
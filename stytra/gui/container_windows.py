@@ -21,6 +21,7 @@ from stytra.gui.camera_display import CameraViewWidget
 from stytra.gui.buttons import IconButton, ToggleIconButton
 from stytra.gui.status_display import StatusMessageDisplay
 from stytra.gui.framerate_viewer import MultiFrameratesWidget
+from stytra.gui.latency_viewer import LatencyWidget
 
 from stytra.stimulation.stimulus_display import StimulusDisplayOnMainWindow
 
@@ -367,9 +368,8 @@ class TrackingExperimentWindow(CameraExperimentWindow):
 
         self.track_params_wnd = None
 
-        self.status_display.addMessageQueue(
-            self.experiment.frame_dispatcher.message_queue
-        )
+        for process in self.experiment.tracking_processes:
+            self.status_display.addMessageQueue(process.message_queue)
 
     def construct_ui(self):
         """ """
@@ -386,6 +386,17 @@ class TrackingExperimentWindow(CameraExperimentWindow):
 
         self.plot_framerate.add_framerate(self.experiment.acc_tracking_framerate)
 
+        # the latency histograms are shown next to the framerates
+        self.plot_latency = LatencyWidget(self.experiment.latency_monitor)
+        self.experiment.gui_timer.timeout.connect(self.plot_latency.update)
+        latency_dock = QDockWidget("Latencies", self)
+        latency_dock.setObjectName("dock_latency")
+        latency_dock.setWidget(self.plot_latency)
+        self.add_dock(latency_dock)
+        self.splitDockWidget(
+            self.docks["dock_framerates"], latency_dock, Qt.Horizontal
+        )
+
         if self.extra_widget:
             self.experiment.gui_timer.timeout.connect(self.extra_widget.update)
 
@@ -26,8 +26,6 @@ class StreamingPositionPlot(pg.GraphicsWindow):
 
         self.n_points = n_points
         self.data_accumulator = data_accumulator
-        self.ind_x = self.data_accumulator.columns.index("x")
-        self.ind_y = self.data_accumulator.columns.index("y")
 
     def update(self):
         """ """
@@ -35,8 +33,7 @@ class StreamingPositionPlot(pg.GraphicsWindow):
             data_array = self.data_accumulator.get_last_n(self.n_points)
             velocity = np.r_[
                 np.clip(
-                    np.diff(data_array[:, self.ind_x]) ** 2
-                    + np.diff(data_array[:, self.ind_y]) ** 2,
+                    np.diff(data_array.x) ** 2 + np.diff(data_array.y) ** 2,
                     0,
                     30,
                 )
@@ -44,8 +41,8 @@ class StreamingPositionPlot(pg.GraphicsWindow):
                 [0],
             ]
             self.curve.setData(
-                x=data_array[:, self.ind_x],
-                y=data_array[:, self.ind_y],
+                x=data_array.x,
+                y=data_array.y,
                 color=np.stack(
                     [
                         0.5 + 0.5 * velocity,
@@ -57,7 +54,7 @@ class StreamingPositionPlot(pg.GraphicsWindow):
                 ),
             )
 
-        except (IndexError, TypeError):
+        except (IndexError, TypeError, AttributeError):
             pass
 
 
@@ -102,10 +99,11 @@ class TailStreamPlot(QWidget):
     def update(self):
         if not self.isVisible():
             return
-        data_array = np.array(self.acc.stored_data[-self.n_points :])
-        if len(data_array) > 0:
+        window = self.acc.get_last_n(self.n_points)
+        if window is not None:
+            # the first column is the time, the second the tail sum
             self.image_item.setImage(
-                image=np.diff(data_array[:, 1:], axis=1).T, autoLevels=False
+                image=np.diff(window.values[:, 2:], axis=1).T, autoLevels=False
             )
 
 
@@ -204,27 +202,16 @@ class BoutPlot(QWidget):
         if not self.isVisible():
             return
 
-        current_index = len(self.acc.stored_data)
+        current_index = len(self.acc)
         if current_index == 0 or current_index < self.processed_index + 2:
             return
 
         # Pull the new data from the accumulator
-        new_coords = np.array(
-            self.acc.stored_data[
-                max(
-                    self.processed_index, current_index - self.n_save_max
-                ) : current_index
-            ]
-        )
+        new_coords = self.acc.get_last_n(
+            min(current_index - self.processed_index, self.n_save_max)
+        )[["f{:d}_{}".format(self.i_fish, var) for var in ["x", "y", "theta"]]]
         self.processed_index = current_index
 
-        ix, iy, ith = (
-            self.acc.header_dict["f{:d}_{}".format(self.i_fish, var)]
-            for var in ["x", "y", "theta"]
-        )
-
-        new_coords = new_coords[:, [ix, iy, ith]]
-
         # if in the previous refresh we ended up inside a bout, there are still
         # coordinates left to process
         if self.old_coords is not None:
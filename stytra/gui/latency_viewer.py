@@ -0,0 +1,75 @@
+from PyQt5.QtWidgets import QWidget, QVBoxLayout, QLabel
+import pyqtgraph as pg
+import numpy as np
+
+from stytra.collectors.latency import LatencyHistogram
+
+
+class LatencyWidget(QWidget):
+    """ Histograms of the latencies of the closed-loop stages, measured
+    from the camera frame timestamp, with their median and 99th percentile.
+
+    Parameters
+    ----------
+    latency_monitor : LatencyMonitor
+    update_every : int
+        the plot is redrawn every update_every calls of update
+
+    """
+
+    colors = [
+        (40, 230, 150),
+        (230, 200, 40),
+        (40, 150, 230),
+        (230, 100, 40),
+        (200, 80, 230),
+    ]
+
+    def __init__(self, latency_monitor, update_every=20):
+        super().__init__()
+        self.monitor = latency_monitor
+        self.update_every = update_every
+        self.i_update = 0
+
+        self.plot = pg.PlotWidget()
+        self.plot.setLogMode(x=True, y=False)
+        self.plot.setLabel("bottom", "latency from frame", units="s")
+        self.plot.hideAxis("left")
+        self.plot.setMouseEnabled(x=False, y=False)
+        self.plot.setMinimumHeight(100)
+        self.plot.addLegend()
+        self.curves = {
+            stage: self.plot.plot(pen=pg.mkPen(color), name=stage)
+            for stage, color in zip(self.monitor.stages, self.colors)
+        }
+        self.lbl_stats = QLabel()
+
+        self.setLayout(QVBoxLayout())
+        self.layout().setContentsMargins(0, 0, 0, 0)
+        self.layout().addWidget(self.plot)
+        self.layout().addWidget(self.lbl_stats)
+
+    def update(self):
+        self.i_update = (self.i_update + 1) % self.update_every
+        if self.i_update != 0:
+            return
+
+        # bins are plotted at their geometric centers
+        edges = LatencyHistogram.bin_edges
+        centers = np.sqrt(edges[1:] * edges[:-1])
+        stats = []
+        for stage, histogram in self.monitor.histograms.items():
+            if histogram.n == 0:
+                self.curves[stage].clear()
+                continue
+            counts = histogram.counts[1:-1]
+            self.curves[stage].setData(centers, counts / max(counts.max(), 1))
+            stats.append(
+                "{}: {:.1f} / {:.1f} ms".format(
+                    stage,
+                    histogram.percentile(50) * 1000,
+                    histogram.percentile(99) * 1000,
+                )
+            )
+        self.lbl_stats.setText("median / 99%  " + "  ".join(stats))
+        super().update()
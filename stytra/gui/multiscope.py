@@ -326,14 +326,14 @@ class MultiStreamPlot(QWidget):
             if len(data_frame) > self.n_points_max:
                 data_frame = data_frame[:: len(data_frame) // self.n_points_max]
 
-            time_array = delta_t + data_frame.t.values
+            time_array = delta_t + data_frame.t
 
             # loop to handle nan values in a single column
             new_bounds = np.zeros((len(sel_cols), 2))
 
             for id, col in enumerate(sel_cols):
                 # Exclude nans from calculation of percentile boundaries:
-                d = data_frame[col].values
+                d = data_frame[col]
                 if d.dtype != np.float64:
                     continue
                 b = ~np.isnan(d)
@@ -353,11 +353,11 @@ class MultiStreamPlot(QWidget):
                 else:
                     self.stream_items[i_stream].curve.setData(
                         x=time_array,
-                        y=i_stream + ((data_frame[col].values - lb) / scale),
+                        y=i_stream + ((data_frame[col] - lb) / scale),
                     )
                 self._set_labels(
                     self.stream_items[i_stream],
-                    values=(lb, ub, data_frame[col].values[-1]),
+                    values=(lb, ub, data_frame[col][-1]),
                 )
                 i_stream += 1
 
@@ -1,4 +1,5 @@
 import datetime
+import time
 from copy import deepcopy
 
 from PyQt5.QtCore import pyqtSignal, QTimer, QObject
@@ -103,6 +104,9 @@ class ProtocolRunner(QObject):
         self.framerate_rec = FramerateRecorder()
         self.framerate_acc = FramerateAccumulator(experiment=self.experiment)
 
+        # timestamp of the camera frame of the estimate the stimulus uses
+        self.frame_time = None
+
     def update_protocol(self):
         """Update current Protocol (get a new stimulus list)
         """
@@ -203,6 +207,7 @@ class ProtocolRunner(QObject):
                     self.current_stimulus.start()
 
             self.current_stimulus.update()  # use stimulus update function
+            self.record_latency()
             self.sig_timestep.emit(self.i_current_stimulus)
 
             # If stimulus is a constantly changing stimulus:
@@ -214,6 +219,16 @@ class ProtocolRunner(QObject):
             if self.framerate_rec.i_fps == self.framerate_rec.n_fps_frames - 1:
                 self.framerate_acc.update_list(self.framerate_rec.current_framerate)
 
+    def record_latency(self):
+        """ If the stimulus has been updated with an estimate from a new
+        camera frame, records the latency from the frame
+        """
+        estimator = getattr(self.experiment, "estimator", None)
+        frame_time = getattr(estimator, "frame_time", None)
+        if frame_time is not None and frame_time != self.frame_time:
+            self.frame_time = frame_time
+            self.experiment.latency_monitor.add("stimulus", time.time() - frame_time)
+
     def stop(self):
         """Stop the stimulation sequence. Update log and stop timer.
         """
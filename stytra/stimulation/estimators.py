@@ -1,22 +1,263 @@
 import numpy as np
 import datetime
+import time
 
 from stytra.collectors import QueueDataAccumulator
+from stytra.collectors.shared_ring import SharedLatestRecords
 from stytra.utilities import reduce_to_pi
 from collections import namedtuple
 
 
+class OnlineEstimator:
+    """ Part of an estimator which runs in the tracking process. It gets
+    every tracking output, in frame order, as soon as it is computed and
+    publishes the estimates in shared memory, where the Estimator in
+    the GUI process reads the latest ones when the stimulus needs them.
+
+    Subclasses define the names of the estimated values in fields and
+    compute them in update.
+
+    Parameters
+    ----------
+    n_keep: int
+        number of past estimates kept for lagged readouts
+
+    """
+
+    fields = ()
+
+    def __init__(self, n_keep=1024):
+        self.output = SharedLatestRecords(self.fields, n_keep)
+
+    def update(self, t, data):
+        """ Computes the estimate for a new tracking output
+
+        Parameters
+        ----------
+        t: float
+            timestamp of the frame
+        data: namedtuple
+            tracking output
+
+        Returns
+        -------
+        tuple of the estimated values, or None if there is no new estimate
+
+        """
+        raise NotImplementedError
+
+    def process(self, t, data):
+        estimate = self.update(t, data)
+        if estimate is not None:
+            self.output.put(t, estimate)
+
+
+class RollingMoments:
+    """ Mean and standard deviation of the last n samples of a stream,
+    ignoring NaNs. The samples are kept in a fixed ring and the moments are
+    updated in constant time when a sample enters and one leaves the window
+    (Welford's algorithm with removal). They are recomputed from the ring
+    when the window length changes, and every time the ring is filled to
+    avoid accumulating rounding errors.
+
+    Parameters
+    ----------
+    n: int
+        window length, in samples
+    capacity: int
+        length of the ring, the maximal window length is capacity - 1
+
+    """
+
+    def __init__(self, n=2, capacity=512):
+        self.values = [np.nan] * capacity
+        self.capacity = capacity
+        self.n = min(n, capacity - 1)
+        self.i = 0
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def _add(self, x):
+        self.count += 1
+        delta = x - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (x - self.mean)
+
+    def _remove(self, x):
+        self.count -= 1
+        if self.count == 0:
+            self.mean = 0.0
+            self.m2 = 0.0
+            return
+        delta = x - self.mean
+        self.mean -= delta / self.count
+        self.m2 -= delta * (x - self.mean)
+
+    def _recompute(self):
+        window = [x for x in self.window() if x == x]
+        self.count = len(window)
+        self.mean = sum(window) / self.count if self.count > 0 else 0.0
+        self.m2 = sum((x - self.mean) ** 2 for x in window)
+
+    def window(self):
+        """ The samples in the window, oldest first """
+        return [
+            self.values[i % self.capacity]
+            for i in range(max(self.i - self.n, 0), self.i)
+        ]
+
+    def append(self, x):
+        if self.i >= self.n:
+            old = self.values[(self.i - self.n) % self.capacity]
+            if old == old:
+                self._remove(old)
+        self.values[self.i % self.capacity] = x
+        if x == x:
+            self._add(x)
+        self.i += 1
+        if self.i % self.capacity == 0:
+            self._recompute()
+
+    def set_window(self, n):
+        n = min(max(n, 1), self.capacity - 1)
+        if n != self.n:
+            self.n = n
+            self._recompute()
+
+    @property
+    def first(self):
+        """ The oldest sample in the window """
+        if self.i == 0:
+            return np.nan
+        return self.values[max(self.i - self.n, 0) % self.capacity]
+
+    @property
+    def nanmean(self):
+        return self.mean if self.count > 0 else np.nan
+
+    @property
+    def nanstd(self):
+        return np.sqrt(max(self.m2, 0.0) / self.count) if self.count > 0 else np.nan
+
+
+class OnlineVigor(OnlineEstimator):
+    """ Standard deviation of the tail sum over a time window. The window
+    length in samples follows the average frame interval.
+    """
+
+    fields = ("vigor",)
+
+    def __init__(self, vigor_window=0.050, max_samples=512, **kwargs):
+        super().__init__(**kwargs)
+        self.vigor_window = vigor_window
+        self.last_dt = 1 / 500.0
+        self.last_t = None
+        self.vigor = RollingMoments(self._n_samples(vigor_window), max_samples)
+
+    def _n_samples(self, window, current=None):
+        """ Number of samples in a time window, changed only if it is off
+        by more than 3/4 of a sample, to avoid switching back and forth
+        """
+        n = window / self.last_dt
+        if current is not None and abs(n - current) < 0.75:
+            return current
+        return max(int(round(n)), 2)
+
+    def _add_sample(self, t, data):
+        if self.last_t is not None and t > self.last_t:
+            self.last_dt += 0.02 * ((t - self.last_t) - self.last_dt)
+        self.last_t = t
+        tail_sum = float(getattr(data, "tail_sum", np.nan))
+        self.vigor.set_window(self._n_samples(self.vigor_window, self.vigor.n))
+        self.vigor.append(tail_sum)
+        return tail_sum
+
+    def update(self, t, data):
+        self._add_sample(t, data)
+        return (self.vigor.nanstd,)
+
+
+class OnlineTailSum(OnlineVigor):
+    """ Vigor, and the mean tail sum relative to the start of a time
+    window, which gives the direction of the bouts
+    """
+
+    fields = ("vigor", "theta")
+
+    def __init__(self, *args, theta_window=0.07, max_samples=512, **kwargs):
+        super().__init__(*args, max_samples=max_samples, **kwargs)
+        self.theta_window = theta_window
+        self.theta = RollingMoments(self._n_samples(theta_window), max_samples)
+
+    def update(self, t, data):
+        tail_sum = self._add_sample(t, data)
+        self.theta.set_window(self._n_samples(self.theta_window, self.theta.n))
+        self.theta.append(tail_sum)
+        return self.vigor.nanstd, self.theta.nanmean - self.theta.first
+
+
+class OnlinePosition(OnlineEstimator):
+    """ Position of the first fish, in camera coordinates """
+
+    fields = ("x", "y", "theta")
+
+    def update(self, t, data):
+        return (
+            getattr(data, "f0_x", np.nan),
+            getattr(data, "f0_y", np.nan),
+            getattr(data, "f0_theta", np.nan),
+        )
+
+
 class Estimator:
     """
     An estimator is an object that estimate quantities required for the
     control of the stimulus (animal position/speed etc.) from the output
     stream of the tracking pipelines (position in pixels, tail angles, etc.).
+
+    If the estimator has an OnlineEstimator in self.online, the estimates
+    are computed in the tracking process and the latest ones are read
+    from shared memory, otherwise the tracking accumulator can be used.
+    The timestamp of the camera frame of the last estimate read is kept in
+    self.frame_time, the latency from it to the moment the estimate was
+    read in self.latency, and the part of it spent before the estimate was
+    published in self.processing_latency (both in seconds).
     """
 
     def __init__(self, acc_tracking: QueueDataAccumulator, experiment):
         self.exp = experiment
         self.log = experiment.estimator_log
         self.acc_tracking = acc_tracking
+        self.online = None
+        self.frame_time = None
+        self.latency = np.nan
+        self.processing_latency = np.nan
+
+    def read_estimate(self, lag=0):
+        """ Reads the estimate published by the tracking process
+
+        Parameters
+        ----------
+        lag: float
+            how many seconds before the latest estimate
+
+        Returns
+        -------
+        (time since the experiment start, namedtuple of the estimate)
+        or None if there is no estimate yet
+
+        """
+        output = self.online.output
+        estimate = output.get(output.n_back_for(lag))
+        if estimate is None:
+            return None
+        t_frame, t_published, values = estimate
+        if lag == 0:
+            self.frame_time = t_frame
+            self.latency = time.time() - t_frame
+            self.processing_latency = t_published - t_frame
+        return t_frame - self.exp.t0.timestamp(), values
 
     def reset(self):
         self.log.reset()
@@ -32,9 +273,9 @@ class VigorMotionEstimator(Estimator):
     def __init__(self, *args, vigor_window=0.050, base_gain=-12, **kwargs):
         super().__init__(*args, **kwargs)
         self.vigor_window = vigor_window
-        self.last_dt = 1 / 500.0
         self.base_gain = base_gain
         self._output_type = namedtuple("s", "vigor")
+        self.online = OnlineVigor(vigor_window)
 
     def get_velocity(self, lag=0):
         """
@@ -48,23 +289,14 @@ class VigorMotionEstimator(Estimator):
         -------
 
         """
-        vigor_n_samples = max(int(round(self.vigor_window / self.last_dt)), 2)
-        n_samples_lag = max(int(round(lag / self.last_dt)), 0)
-        if not self.acc_tracking.stored_data:
+        estimate = self.read_estimate(lag)
+        if estimate is None:
             return 0
-        past_tail_motion = self.acc_tracking.get_last_n(
-            vigor_n_samples + n_samples_lag
-        )[0:vigor_n_samples]
-        end_t = past_tail_motion.t.iloc[-1]
-        start_t = past_tail_motion.t.iloc[0]
-        new_dt = (end_t - start_t) / vigor_n_samples
-        if new_dt > 0:
-            self.last_dt = new_dt
-        vigor = np.nanstd(np.array(past_tail_motion.tail_sum))
+        end_t, (vigor,) = estimate
         if np.isnan(vigor):
             vigor = 0
 
-        if len(self.log.times) == 0 or self.log.times[-1] < end_t:
+        if len(self.log) == 0 or self.log.times[-1] < end_t:
             self.log.update_list(end_t, self._output_type(vigor))
         return vigor * self.base_gain
 
@@ -72,9 +304,8 @@ class VigorMotionEstimator(Estimator):
 class BoutsEstimator(VigorMotionEstimator):
     def __init__(self, *args, bout_threshold = 0.05, vigor_window=0.05,
                  min_interbout=0.1, **kwargs):
-        super().__init__(*args, base_gain=1, **kwargs)
+        super().__init__(*args, vigor_window=vigor_window, base_gain=1, **kwargs)
         self.bout_threshold = bout_threshold
-        self.vigor_window = vigor_window
         self.min_interbout = min_interbout
         self.last_bout_t = None
 
@@ -94,7 +325,6 @@ class TailSumEstimator(Estimator):
         super().__init__(*args, **kwargs)
         self.vigor_window = vigor_window
         self.theta_window = theta_window
-        self.last_dt = 1 / 500.0
         self.base_gain = base_gain
         self._output_type = namedtuple("s", ("vigor", "theta", "bout_on"))
         self.bout_threshold = bout_threshold
@@ -110,6 +340,7 @@ class TailSumEstimator(Estimator):
         self.last_bout_on = 0
 
         self.tail_th = 0
+        self.online = OnlineTailSum(vigor_window, theta_window=theta_window)
 
     def bout_occured(self):
         if self.bout_on:
@@ -131,20 +362,10 @@ class TailSumEstimator(Estimator):
         -------
 
         """
-        # Vigor (copypasted from VigorEstimator method for simplicity)
-        vigor_n_samples = max(int(round(self.vigor_window / self.last_dt)), 2)
-        n_samples_lag = max(int(round(lag / self.last_dt)), 0)
-        if not self.acc_tracking.stored_data:
+        estimate = self.read_estimate(lag)
+        if estimate is None:
             return 0, 0, 0
-        past_tail_motion = self.acc_tracking.get_last_n(
-            vigor_n_samples + n_samples_lag
-        )[0:vigor_n_samples]
-        end_t = past_tail_motion.t.iloc[-1]
-        start_t = past_tail_motion.t.iloc[0]
-        new_dt = (end_t - start_t) / vigor_n_samples
-        if new_dt > 0:
-            self.last_dt = new_dt
-        vigor = np.nanstd(np.array(past_tail_motion.tail_sum))
+        end_t, (vigor, theta) = estimate
 
         if vigor is not None:
             self.bout_on = int(vigor > self.bout_threshold)
@@ -162,13 +383,7 @@ class TailSumEstimator(Estimator):
 
         if not self.theta_provided:  # and (datetime.datetime.now() - self.bout_start_t).total_seconds() > 0.07:
             # Tail theta:
-            th_n_samples = max(int(round(self.theta_window / self.last_dt)), 2)
-            n_samples_lag = max(int(round(lag / self.last_dt)), 0)
-
-            past_tail_motion = self.acc_tracking.get_last_n(
-                th_n_samples + n_samples_lag
-            )[0:th_n_samples]
-            self.tail_th = np.nanmean(np.array(past_tail_motion.tail_sum) - past_tail_motion.tail_sum.iloc[0])
+            self.tail_th = theta
             self.theta_provided = True
         else:
             self.tail_th = self.tail_th*(3/4)
@@ -213,27 +428,23 @@ class PositionEstimator(Estimator):
             self.change_thresholds = np.array(change_thresholds)
 
         self._output_type = namedtuple("f", ["x", "y", "theta"])
+        self.online = OnlinePosition()
 
     def get_camera_position(self):
-        past_coords = {
-            name: value
-            for name, value in zip(
-                self.acc_tracking.columns, self.acc_tracking.get_last_n(1)[0, :]
-            )
-        }
-        return past_coords["f0_x"], past_coords["f0_y"], past_coords["f0_theta"]
+        estimate = self.read_estimate()
+        if estimate is None:
+            return np.nan, np.nan, np.nan
+        return tuple(estimate[1])
 
     def get_velocity(self):
         vel = np.diff(
-            self.acc_tracking.get_last_n(self.velocity_window)[["f0_x", "f0_y"]].values,
+            self.acc_tracking.get_last_n(self.velocity_window)[["f0_x", "f0_y"]],
             0,
         )
         return np.sqrt(np.sum(vel ** 2))
 
     def get_istantaneous_velocity(self):
-        vel_xy = self.acc_tracking.get_last_n(self.velocity_window)[
-            ["f0_vx", "f0_vy"]
-        ].values
+        vel_xy = self.acc_tracking.get_last_n(self.velocity_window)[["f0_vx", "f0_vy"]]
         return np.sqrt(np.sum(vel_xy ** 2))
 
     def reset(self):
@@ -241,32 +452,30 @@ class PositionEstimator(Estimator):
         self.past_values = None
 
     def get_position(self):
-        if len(self.acc_tracking.stored_data) == 0 or not np.isfinite(
-            self.acc_tracking.stored_data[-1].f0_x
-        ):
+        estimate = self.read_estimate()
+        if estimate is None or not np.isfinite(estimate[1].x):
             o = self._output_type(np.nan, np.nan, np.nan)
             return o
 
-        past_coords = self.acc_tracking.stored_data[-1]
-        t = self.acc_tracking.times[-1]
+        t, past_coords = estimate
 
         if not self.calibrator.cam_to_proj is None:
             projmat = np.array(self.calibrator.cam_to_proj)
             if projmat.shape != (2, 3):
                 projmat = np.array([[1.0, 0.0, 0.0], [0.0, 1.0, 0.0]])
 
-            x, y = projmat @ np.array([past_coords.f0_x, past_coords.f0_y, 1.0])
+            x, y = projmat @ np.array([past_coords.x, past_coords.y, 1.0])
 
             theta = np.arctan2(
                 *(
                     projmat[:, :2]
                     @ np.array(
-                        [np.cos(past_coords.f0_theta), np.sin(past_coords.f0_theta)]
+                        [np.cos(past_coords.theta), np.sin(past_coords.theta)]
                     )[::-1]
                 )
             )
         else:
-            x, y, theta = past_coords.f0_x, past_coords.f0_y, past_coords.f0_theta
+            x, y, theta = past_coords.x, past_coords.y, past_coords.theta
 
         c_values = np.array((y, x, theta))
 
@@ -1,4 +1,5 @@
 from datetime import datetime
+import time
 
 import numpy as np
 import qimage2ndarray
@@ -189,6 +190,9 @@ class StimDisplayWidget:
         self.movie = []
         self.movie_timestamps = []
 
+        # camera frame time of the last painted closed-loop stimulus state
+        self.painted_frame_time = None
+
     def paintEvent(self, QPaintEvent):
         """Generate the stimulus that will be displayed. A QPainter object is
         defined, which is then passed to the current stimulus paint function
@@ -226,6 +230,14 @@ class StimDisplayWidget:
 
         p.end()
 
+        if self.protocol_runner is not None and self.protocol_runner.running:
+            frame_time = self.protocol_runner.frame_time
+            if frame_time is not None and frame_time != self.painted_frame_time:
+                self.painted_frame_time = frame_time
+                self.protocol_runner.experiment.latency_monitor.add(
+                    "display", time.time() - frame_time
+                )
+
     def display_stimulus(self):
         """Function called by the protocol_runner timestep timer that update
         the displayed image and, if required, grab a picture of the current
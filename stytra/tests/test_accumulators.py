@@ -0,0 +1,83 @@
+from stytra.collectors.accumulators import DataFrameAccumulator
+from stytra.collectors.streaming import StreamingLogWriter
+from types import SimpleNamespace
+from datetime import datetime, timedelta
+import numpy as np
+import pandas as pd
+import flammkuchen as fl
+
+
+def make_accumulator(**kwargs):
+    exp = SimpleNamespace(
+        t0=datetime.now(), protocol_runner=SimpleNamespace(running=True)
+    )
+    acc = DataFrameAccumulator(experiment=exp, initial_length=4, **kwargs)
+    acc.set_fields(["x", "y"])
+    return acc
+
+
+def test_growing_accumulator():
+    acc = make_accumulator()
+    for i in range(10):
+        acc.append(i * 0.1, (i, -i))
+    acc.append_batch(np.arange(10, 20) * 0.1, np.stack([np.arange(10, 20)] * 2, 1))
+
+    assert len(acc) == 20
+    assert acc[-1] == acc._tuple_type(19, 19)
+    np.testing.assert_equal(acc["x"], np.arange(20))
+
+    window = acc.get_last_n(5)
+    np.testing.assert_equal(window.x, np.arange(15, 20))
+    assert np.shares_memory(window.x, acc._data)
+    np.testing.assert_equal(window[["x", "y"]][0], [15, 15])
+    np.testing.assert_allclose(window[1:3].t, [1.6, 1.7])
+
+    np.testing.assert_equal(acc.get_last_t(0.25).x, [17, 18, 19])
+    assert acc.values_at_abs_time(acc.exp.t0 + timedelta(seconds=0.55)).x == 5
+
+    df = acc.get_dataframe()
+    assert list(df.columns) == ["x", "y", "t"]
+    np.testing.assert_equal(df.y.values[:10], -np.arange(10))
+
+
+def test_ring_accumulator():
+    acc = make_accumulator(max_length=8)
+    for i in range(100):
+        acc.append(i, (i, i))
+    assert len(acc) == 8
+    assert acc._data.shape[1] <= 16
+    np.testing.assert_equal(acc.get_last_n(100).x, np.arange(92, 100))
+
+    acc.exp.protocol_runner.running = False
+    acc.max_history_if_not_running = 2
+    acc.trim_data()
+    np.testing.assert_equal(acc.t, [98, 99])
+
+
+def test_streaming_accumulator(tmp_path):
+    acc = make_accumulator(max_history_if_streaming=10)
+    acc.max_history_if_not_running = 10
+    for fileformat, read in [
+        ("hdf5", lambda path: fl.load(path, "/data")),
+        ("csv", lambda path: pd.read_csv(path, sep=";", index_col=0)),
+        ("feather", pd.read_feather),
+    ]:
+        acc.reset()
+        path = str(tmp_path / ("log_" + fileformat))
+        writer = StreamingLogWriter(path, fileformat)
+        writer.start()
+        acc.start_streaming(writer)
+        for i in range(100):
+            acc.append(i * 0.1, (i, -i))
+            acc.trim_data()
+            if i % 30 == 0:
+                acc.flush()
+        # only the last samples are kept in memory
+        assert len(acc) < 50
+
+        filename = acc.save(path, fileformat)
+        assert acc.sink is None
+        df = read(str(tmp_path / filename))
+        assert list(df.columns) == ["x", "y", "t"]
+        np.testing.assert_equal(df.x.values, np.arange(100))
+        np.testing.assert_allclose(df.t.values, np.arange(100) * 0.1)
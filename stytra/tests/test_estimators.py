@@ -0,0 +1,34 @@
+from stytra.stimulation.estimators import RollingMoments, OnlineTailSum
+from collections import namedtuple
+import numpy as np
+
+
+def test_rolling_moments():
+    np.random.seed(0)
+    values = np.random.randn(3000)
+    values[np.random.rand(3000) < 0.1] = np.nan
+    values[1000:1030] = np.nan
+    moments = RollingMoments(25, capacity=100)
+    for i, x in enumerate(values):
+        if i == 1500:
+            moments.set_window(40)
+        moments.append(x)
+        window = values[max(i + 1 - moments.n, 0) : i + 1]
+        if np.all(np.isnan(window)):
+            assert np.isnan(moments.nanstd)
+        else:
+            np.testing.assert_allclose(moments.nanstd, np.nanstd(window))
+            np.testing.assert_allclose(moments.nanmean, np.nanmean(window))
+        np.testing.assert_equal(moments.first, window[0])
+
+
+def test_online_tail_sum():
+    data = namedtuple("t", "tail_sum")
+    estimator = OnlineTailSum(vigor_window=0.05, theta_window=0.07)
+    tail_sums = np.sin(np.arange(1000) / 10)
+    for i, tail_sum in enumerate(tail_sums):
+        estimator.process(i / 500, data(tail_sum))
+
+    _, _, (vigor, theta) = estimator.output.get()
+    np.testing.assert_allclose(vigor, np.std(tail_sums[-25:]))
+    np.testing.assert_allclose(theta, np.mean(tail_sums[-35:] - tail_sums[-35]))
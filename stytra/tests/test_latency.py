@@ -0,0 +1,18 @@
+from stytra.collectors.latency import LatencyHistogram, LatencyMonitor
+import numpy as np
+
+
+def test_latency_histogram():
+    histogram = LatencyHistogram()
+    histogram.add(np.r_[np.full(98, 0.005), 0.05, np.nan, 100.0])
+    assert histogram.n == 100
+    # percentiles are given with the resolution of the bins
+    np.testing.assert_allclose(histogram.percentile(50), 0.005, rtol=0.13)
+    np.testing.assert_allclose(histogram.percentile(99), 0.05, rtol=0.13)
+    assert histogram.max == 100.0
+
+    monitor = LatencyMonitor()
+    monitor.add("tracking", 0.002)
+    summary = monitor.summary()
+    assert list(summary["stages"].keys()) == ["tracking"]
+    assert sum(summary["stages"]["tracking"]["counts"]) == 1
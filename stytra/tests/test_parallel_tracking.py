@@ -0,0 +1,50 @@
+import numpy as np
+from stytra.tracking.tracking_process import OrderedFrameBuffer
+from stytra.experiments.fish_pipelines import TailTrackingPipeline
+
+
+def test_frame_reordering():
+    buf = OrderedFrameBuffer(max_pending=3)
+    for i in [1, 0, 3, 2]:
+        buf.put(i, i)
+    assert list(buf.pop_ready()) == [0, 1, 2, 3]
+
+    # a missing frame is waited for until max_pending outputs are waiting
+    for i in [5, 6, 7]:
+        buf.put(i, i)
+    assert list(buf.pop_ready()) == []
+    buf.put(8, 8)
+    assert list(buf.pop_ready()) == [5, 6, 7, 8]
+    assert buf.n_skipped == 1
+
+    # frames arriving after they were skipped are discarded
+    buf.put(4, 4)
+    assert list(buf.pop_ready()) == []
+    assert buf.n_late == 1
+
+
+def test_synchronized_state():
+    """ The time filter applied in order on the outputs of a pipeline
+    in a worker gives the same results as running it in the pipeline
+    """
+    assert TailTrackingPipeline().parallel_policy == "synchronized"
+
+    np.random.seed(0)
+    frames = np.random.randint(0, 255, (5, 100, 100)).astype(np.uint8)
+    params = {"/source/filtering/tail_tracking": dict(time_filter_weight=0.5)}
+
+    inline = TailTrackingPipeline()
+    inline.setup()
+    inline.deserialize_params(params)
+
+    worker = TailTrackingPipeline()
+    worker.setup(synchronize_externally=True)
+    worker.deserialize_params(params)
+    ordered = TailTrackingPipeline()
+    ordered.setup()
+    ordered.deserialize_params(params)
+
+    for frame in frames:
+        expected = inline.run(frame).data
+        result = ordered.synchronize_state(worker.run(frame).data)
+        np.testing.assert_allclose(np.array(result), np.array(expected))
@@ -38,3 +38,30 @@ def test_a_pipeline():
     p.deserialize_params(ser)
     assert p.run(None) == NodeOutput([], tt(None, 2))
     assert p.diagnostic_image == "img"
+
+
+class OtherTestNode(ImageToDataNode):
+    def __init__(self, *args, **kwargs):
+        super().__init__("othernode", *args, **kwargs)
+        self._output_type = namedtuple("o", "doubled")
+
+    def _process(self, input):
+        return NodeOutput(["I:other"], self._output_type(doubled=2 * input))
+
+
+class BranchedPipeline(Pipeline):
+    def __init__(self):
+        super().__init__()
+        self.tp = TestNode()
+        self.tp.parent = self.root
+        self.tp2 = OtherTestNode()
+        self.tp2.parent = self.root
+
+
+def test_compiled_run():
+    p = BranchedPipeline()
+    p.setup()
+    assert [node for node, _ in p._plan] == [p.root, p.tp, p.tp2]
+    compiled = p.run(3)
+    assert compiled.data._fields == ("inp", "par", "doubled")
+    assert compiled == p.recursive_run(p.root, 3)
@@ -0,0 +1,40 @@
+from stytra.tracking.preprocessing import Prefilter
+from stytra.benchmarks.preprocessing import (
+    legacy_prefilter,
+    embedded_tail_pipeline,
+    TAIL_VIDEO,
+)
+import flammkuchen as fl
+import numpy as np
+
+
+def test_prefilter():
+    np.random.seed(0)
+    prefilter = Prefilter()
+    prefilter.setup()
+    for params in [
+        dict(),
+        dict(image_scale=1, color_invert=False),
+        dict(image_scale=0.3, filter_size=0, clip=0),
+    ]:
+        prefilter._params.params.values = params
+        values = prefilter._params.params.values
+        outputs = []
+        for shape in [(100, 120), (100, 120), (64, 64)]:
+            im = np.random.randint(0, 255, shape).astype(np.uint8)
+            outputs.append(prefilter._process(im, **values).data)
+            np.testing.assert_array_equal(outputs[-1], legacy_prefilter(im, **values))
+        # the buffer is reused for frames of the same shape
+        assert outputs[0] is outputs[1]
+        assert outputs[1] is not outputs[2]
+
+
+def test_prefilter_roi():
+    video = fl.load(str(TAIL_VIDEO), "/video")[:20]
+    outputs = []
+    for crop in [False, True]:
+        frames, pipeline = embedded_tail_pipeline(video, (512, 640), crop)
+        outputs.append(np.array([pipeline.run(frame).data for frame in frames]))
+        # only the region around the tail is filtered
+        assert (pipeline.filter.output_full_shape is not None) == crop
+    np.testing.assert_array_equal(outputs[0], outputs[1])
@@ -0,0 +1,81 @@
+from stytra.collectors.shared_ring import SharedRecordRing, SharedLatestRecords
+from multiprocessing import Process
+from collections import namedtuple
+from datetime import datetime
+from queue import Empty
+import numpy as np
+import pytest
+
+
+class WriterProc(Process):
+    def __init__(self, ring):
+        super().__init__()
+        self.ring = ring
+
+    def run(self):
+        t = namedtuple("t", "a b c")
+        for i in range(10):
+            self.ring.put(datetime.now(), t(i, 2, 3), i)
+
+
+class LatestWriterProc(Process):
+    def __init__(self, records):
+        super().__init__()
+        self.records = records
+
+    def run(self):
+        for i in range(20):
+            self.records.put(i * 0.01, (i, -i))
+
+
+def test_ring_between_processes():
+    ring = SharedRecordRing(max_mbytes=0.01)
+    proc = WriterProc(ring)
+    proc.start()
+    proc.join()
+    times, indices, records = ring.get_batch()
+    assert ring.tuple_type._fields == ("a", "b", "c")
+    np.testing.assert_equal(indices, np.arange(10))
+    np.testing.assert_equal(records["a"], np.arange(10))
+    assert np.all(np.diff(times) >= 0)
+    with pytest.raises(Empty):
+        ring.get_batch()
+
+
+def test_ring_overrun_and_generation():
+    ring = SharedRecordRing(max_mbytes=0.00064)  # 80 values, 20 records of 4
+    t = namedtuple("t", "a")
+    now = datetime.now()
+    for i in range(50):
+        ring.put(now, t(i))
+    _, _, records = ring.get_batch()
+    generation = ring.generation
+    # the slot being written when reading is considered lost
+    np.testing.assert_equal(records["a"], np.arange(31, 50))
+    assert ring.n_dropped == 31
+
+    t2 = namedtuple("t", "x y")
+    ring.put(now, t(50))
+    ring.put(now, t2(1, 2))
+    _, _, records = ring.get_batch()
+    assert ring.generation != generation
+    assert records.dtype.names == ("x", "y")
+    np.testing.assert_equal(records["y"], [2])
+
+    ring.put(now, t2(3, 4))
+    assert ring.get(timeout=0.1) == (now, ring.tuple_type(3, 4))
+
+
+def test_latest_records():
+    records = SharedLatestRecords(("a", "b"), n_keep=8)
+    assert records.get() is None
+    proc = LatestWriterProc(records)
+    proc.start()
+    proc.join()
+    t, t_written, values = records.get()
+    assert t == 0.19 and values == records.tuple_type(19, -19)
+    assert t_written > t
+    # 5 records in 50 ms, older ones are not kept
+    assert records.n_back_for(0.05) == 5
+    assert records.get(5)[2].a == 14
+    assert records.get(100)[2].a == 13
@@ -0,0 +1,41 @@
+from stytra.benchmarks.tail import (
+    filtered_frames,
+    make_tracker,
+    make_multi_tracker,
+    legacy_centroid,
+)
+import numpy as np
+
+
+def test_centroid_tracking():
+    frames = filtered_frames(50)
+    # the parameters are shared by the instances, the defaults are set last
+    for params in [
+        dict(tail_filter_width=1.5, n_output_segments=12),
+        dict(n_segments=20, window_size=6),
+        dict(n_segments=12, window_size=7, tail_filter_width=0.0, n_output_segments=9),
+    ]:
+        tracker, values = make_tracker(
+            reset_zero=False, time_filter_weight=0.0, **params
+        )
+        for frame in frames:
+            np.testing.assert_allclose(
+                tracker(frame), legacy_centroid(frame, **values), atol=1e-12
+            )
+
+
+def test_multi_tail_tracking():
+    frames = filtered_frames(20)
+    tracker, values = make_tracker(reset_zero=False, time_filter_weight=0.0)
+    multi_tracker, _ = make_multi_tracker(
+        frames[0].shape,
+        2,
+        3,
+        n_segments=values["n_segments"],
+        n_output_segments=values["n_output_segments"],
+    )
+    for frame in frames:
+        # each well has the same tail as the single frame
+        output = multi_tracker(np.tile(frame, (2, 3))).reshape(6, -1)
+        for well in output:
+            np.testing.assert_allclose(well[1:], tracker(frame), atol=1e-12)
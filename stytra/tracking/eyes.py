@@ -37,6 +37,11 @@ class EyeTrackingMethod(ImageToDataNode):
 
         self.diagnostic_image_options = ["thresholded"]
 
+    def input_roi(self, shape):
+        x, y = self._params.wnd_pos
+        w, h = self._params.wnd_dim
+        return y, y + h, x, x + w
+
     def _process(
         self,
         im,
@@ -65,11 +70,15 @@ class EyeTrackingMethod(ImageToDataNode):
         message = ""
         PAD = 0
 
+        # the image can be a region of the complete one
+        _, (origin_y, origin_x) = self.input_geometry(im)
+        wnd_x, wnd_y = wnd_pos[0] - origin_x, wnd_pos[1] - origin_y
+
         cropped = _pad(
             (
                 im[
-                    wnd_pos[1] : wnd_pos[1] + wnd_dim[1],
-                    wnd_pos[0] : wnd_pos[0] + wnd_dim[0],
+                    wnd_y : wnd_y + wnd_dim[1],
+                    wnd_x : wnd_x + wnd_dim[0],
                 ]
                 < threshold
             )
@@ -1,219 +1,354 @@
-from lightparam import Parametrized, Param
-from anytree import PreOrderIter, Node, Resolver
-from multiprocessing import Queue
-from collections import namedtuple
-from itertools import chain
-
-
-NodeOutput = namedtuple("NodeOutput", "messages data")
-
-
-class PipelineNode(Node):
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        self._params = None
-        self.diagnostic_image_options = []
-        self.diagnostic_image = None
-        self.set_diagnostic = None
-        self._output_type = None
-
-    def reset(self):
-        pass
-
-    def changed(self, vals):
-        pass
-
-    def setup(self):
-        self._params = Parametrized(params=self._process, name="tracking+" + self.name)
-
-    @property
-    def output_type_changed(self):
-        return False
-
-    @property
-    def strpath(self):
-        return self.separator.join([""] + [str(node.name) for node in self.path])
-
-    def process(self, *inputs) -> NodeOutput:
-        out = self._process(*inputs, **self._params.params.values)
-        try:
-            assert isinstance(out, NodeOutput)
-        except AssertionError:
-            raise TypeError(
-                "Output type of " + self.name + " is wrong, " + str(type(out))
-            )
-        return out
-
-    def _process(self, *inputs, set_diagnostic=None, **kwargs) -> NodeOutput:
-        return NodeOutput([], None)
-
-
-class ImageToImageNode(PipelineNode):
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-
-    @property
-    def output_type_changed(self):
-        return any(c.output_type_changed for c in self.children)
-
-    def acknowledge_changes(self):
-        for c in self.children:
-            c.acknowledge_changes()
-
-
-class SourceNode(ImageToImageNode):
-    def __init__(self, *args, **kwargs):
-        super().__init__("source", *args, **kwargs)
-
-    def _process(self, *input, **kwargs):
-        return NodeOutput([], *input)
-
-
-class ImageToDataNode(PipelineNode):
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        self.monitored_headers = []
-        self._params = None
-        self._output_type_changed = True  # Has to be true to initialize the class
-
-    @property
-    def output_type_changed(self):
-        if self._output_type_changed:
-            return True
-        return False
-
-    def acknowledge_changes(self):
-        self._output_type_changed = False
-
-    def _process(self):
-        # Node processing code
-
-        # Output type handling
-        return None
-
-
-class Pipeline:
-    def __init__(self):
-        self.root = SourceNode()
-
-        self.display_overlay = None
-        self.extra_widget = None
-
-        self.selected_output = None
-        self._output_type = None
-        self.all_params = dict()
-        self._param_finder = Resolver()
-        self.node_dict = dict()
-
-    @property
-    def headers_to_plot(self):
-        hds = []
-        for node in self.node_dict.values():
-            if isinstance(node, ImageToDataNode):
-                hds.extend(node.monitored_headers)
-        return hds
-
-    def setup(self, tree=None):
-        """ Due to multiprocessing limitations, the setup is
-        run separately from the constructor
-
-        """
-        diag_images = []
-        for node in PreOrderIter(self.root):
-            node.setup()
-            if node._params is not None:
-                self.all_params[node.strpath] = node._params
-                if tree is not None:
-                    tree.add(node._params)
-                self.node_dict[node.strpath] = node
-            diag_images.extend(
-                (
-                    node.strpath + "/" + imname
-                    for imname in node.diagnostic_image_options
-                )
-            )
-        self.all_params["diagnostics"] = Parametrized(
-            name="tracking/diagnostics",
-            params=dict(image=Param("unprocessed", ["unprocessed"] + diag_images)),
-            tree=tree,
-        )
-        self.all_params["reset"] = Parametrized(
-            name="tracking/reset",
-            params=dict(reset=Param(False, gui="button")),
-            tree=tree,
-        )
-
-    @property
-    def diagnostic_image(self):
-        imname = self.all_params["diagnostics"].image
-        if imname == "unprocessed":
-            return None
-        # if we are setting the diagnostic image to one from the nodes,
-        # navigate to the node and select the proper diagnostic image
-        try:
-            return self.node_dict["/".join(imname.split("/")[:-1])].diagnostic_image
-        except KeyError:
-            return None
-
-    def serialize_changed_params(self):
-        chg = {n: p.params.changed_values() for n, p in self.all_params.items()}
-        for p in self.all_params.values():
-            p.params.acknowledge_changes()
-        return chg
-
-    def serialize_params(self):
-        return {n: p.params.values for n, p in self.all_params.items()}
-
-    def deserialize_params(self, rec_params):
-        for item, vals in rec_params.items():
-            self.all_params[item].params.values = vals
-            if item != "diagnostics" and item != "reset":
-                self.node_dict[item].changed(vals)
-        if "diagnostics" in rec_params.keys():
-            imname = self.all_params["diagnostics"].image
-            if imname == "unprocessed":
-                for node in self.node_dict.values():
-                    node.set_diagnostic = None
-            else:
-                try:
-                    self.node_dict[
-                        "/".join(imname.split("/")[:-1])
-                    ].set_diagnostic = imname.split("/")[-1]
-                except KeyError:  # this can happen on reloading if the pipeline is changed
-                    self.all_params["diagnostics"].image = "unprocessed"
-        # reset group always exists, checks if there are actual changes (the second and)
-        if "reset" in rec_params.keys() and "reset" in rec_params["reset"].keys():
-            for node in self.node_dict.values():
-                node.reset()
-
-    def recursive_run(self, node: PipelineNode, *input_data):
-        output = node.process(*input_data)
-        if isinstance(node, ImageToDataNode):
-            return output
-
-        child_outputs = tuple(
-            self.recursive_run(child, output.data) for child in node.children
-        )
-        if node._output_type is None or node.output_type_changed:
-            node._output_type = namedtuple(
-                "o", chain.from_iterable(map(lambda x: x.data._fields, child_outputs))
-            )
-
-        # collect all diagnostic messages and return a named tuple collecting
-        # all the outputs
-
-        # first element of the tuple concatenates all lists of diagnostic messages
-        # second element makes a named tuple with fields from all the child named tuples
-        output_tuple = node._output_type(
-            *(chain.from_iterable(map(lambda x: x.data, child_outputs)))
-        )
-        return NodeOutput(
-            output.messages
-            + list(chain.from_iterable(map(lambda x: x.messages, child_outputs))),
-            output_tuple,
-        )
-
-    def run(self, input):
-        out = self.recursive_run(self.root, input)
-        self.root.acknowledge_changes()
-        return out
+from lightparam import Parametrized, Param
+from anytree import PreOrderIter, Node, Resolver
+from multiprocessing import Queue
+from collections import namedtuple
+from itertools import chain
+
+
+NodeOutput = namedtuple("NodeOutput", "messages data")
+
+
+class PipelineNode(Node):
+    """ A processing step of a tracking pipeline
+
+    When tracking is distributed over several processes (see the
+    n_tracking_processes option of Stytra), each node declares
+    how it handles state carried from frame to frame in the
+    parallel_policy attribute:
+
+        - "stateless": the output depends only on the current frame
+        - "replicated": each worker keeps its own copy of the state,
+          suitable for slowly-varying state such as a background image
+        - "synchronized": the per-frame part is stateless, and the state
+          is updated in frame order by the reordering stage, through
+          the synchronize method
+        - "pinned": the state has to see every frame in order,
+          the pipeline can be run only in a single process
+
+    """
+
+    parallel_policy = "stateless"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._params = None
+        self.synchronized_externally = False
+        self.diagnostic_image_options = []
+        self.diagnostic_image = None
+        self.set_diagnostic = None
+        self._output_type = None
+
+    def reset(self):
+        pass
+
+    def changed(self, vals):
+        pass
+
+    def setup(self):
+        self._params = Parametrized(params=self._process, name="tracking+" + self.name)
+
+    @property
+    def output_type_changed(self):
+        return False
+
+    @property
+    def strpath(self):
+        return self.separator.join([""] + [str(node.name) for node in self.path])
+
+    def process(self, *inputs) -> NodeOutput:
+        out = self._process(*inputs, **self._params.params.values)
+        try:
+            assert isinstance(out, NodeOutput)
+        except AssertionError:
+            raise TypeError(
+                "Output type of " + self.name + " is wrong, " + str(type(out))
+            )
+        return out
+
+    def _process(self, *inputs, set_diagnostic=None, **kwargs) -> NodeOutput:
+        return NodeOutput([], None)
+
+    def input_roi(self, shape):
+        """ The region of the input image used by the node, as
+        (y_min, y_max, x_min, x_max) in pixels for an input image of the given
+        shape, or None if the whole image is used. The parent node can then
+        process only this region.
+
+        """
+        return None
+
+    def input_geometry(self, im):
+        """ Shape of the complete input image and (y, x) position of im in
+        it, which are different if the parent processed only a region
+        """
+        full_shape = getattr(self.parent, "output_full_shape", None)
+        if full_shape is None:
+            return im.shape, (0, 0)
+        return full_shape, self.parent.output_origin
+
+    def synchronize(self, data):
+        """ Updates the frame-to-frame state from the complete pipeline
+        output, called in frame order for nodes with the
+        "synchronized" parallel policy
+
+        """
+        return data
+
+
+class ImageToImageNode(PipelineNode):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # if only a region of the output image is computed, the shape of the
+        # complete output and the position of the region in it
+        self.output_full_shape = None
+        self.output_origin = (0, 0)
+
+    def children_roi(self, shape):
+        """ Union of the regions of an output image of the given shape used
+        by the children, None if the whole image is needed
+        """
+        rois = [child.input_roi(shape) for child in self.children]
+        if len(rois) == 0 or any(roi is None for roi in rois):
+            return None
+        y_min, y_max, x_min, x_max = zip(*rois)
+        return min(y_min), max(y_max), min(x_min), max(x_max)
+
+    @property
+    def output_type_changed(self):
+        return any(c.output_type_changed for c in self.children)
+
+    def acknowledge_changes(self):
+        for c in self.children:
+            c.acknowledge_changes()
+
+
+class SourceNode(ImageToImageNode):
+    def __init__(self, *args, **kwargs):
+        super().__init__("source", *args, **kwargs)
+
+    def _process(self, *input, **kwargs):
+        return NodeOutput([], *input)
+
+
+class ImageToDataNode(PipelineNode):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.monitored_headers = []
+        self._params = None
+        self._output_type_changed = True  # Has to be true to initialize the class
+
+    @property
+    def output_type_changed(self):
+        if self._output_type_changed:
+            return True
+        return False
+
+    def acknowledge_changes(self):
+        self._output_type_changed = False
+
+    def _process(self):
+        # Node processing code
+
+        # Output type handling
+        return None
+
+
+class Pipeline:
+    def __init__(self):
+        self.root = SourceNode()
+
+        self.display_overlay = None
+        self.extra_widget = None
+
+        self.selected_output = None
+        self._output_type = None
+
+        # compiled execution plan, see compile
+        self._plan = []
+        self._slots = []
+        self._data_slots = []
+        self.all_params = dict()
+        self._param_finder = Resolver()
+        self.node_dict = dict()
+
+    @property
+    def headers_to_plot(self):
+        hds = []
+        for node in self.node_dict.values():
+            if isinstance(node, ImageToDataNode):
+                hds.extend(node.monitored_headers)
+        return hds
+
+    @property
+    def parallel_policy(self):
+        """ The most restrictive parallel policy among the nodes
+        """
+        policies = {node.parallel_policy for node in PreOrderIter(self.root)}
+        for policy in ["pinned", "synchronized", "replicated"]:
+            if policy in policies:
+                return policy
+        return "stateless"
+
+    def setup(self, tree=None, synchronize_externally=False):
+        """ Due to multiprocessing limitations, the setup is
+        run separately from the constructor
+
+        Parameters
+        ----------
+        tree
+            parameter tree the node parameters are added to
+        synchronize_externally: bool
+            if True, nodes with the "synchronized" parallel policy do not update
+            their state in the run, this is left to a separate stage which calls
+            synchronize_state on the outputs in frame order
+
+        """
+        diag_images = []
+        for node in PreOrderIter(self.root):
+            node.setup()
+            node.synchronized_externally = synchronize_externally
+            if node._params is not None:
+                self.all_params[node.strpath] = node._params
+                if tree is not None:
+                    tree.add(node._params)
+                self.node_dict[node.strpath] = node
+            diag_images.extend(
+                (
+                    node.strpath + "/" + imname
+                    for imname in node.diagnostic_image_options
+                )
+            )
+        self.all_params["diagnostics"] = Parametrized(
+            name="tracking/diagnostics",
+            params=dict(image=Param("unprocessed", ["unprocessed"] + diag_images)),
+            tree=tree,
+        )
+        self.all_params["reset"] = Parametrized(
+            name="tracking/reset",
+            params=dict(reset=Param(False, gui="button")),
+            tree=tree,
+        )
+        self.compile()
+
+    def compile(self):
+        """ Flattens the node tree into a list of (node, index of the parent
+        output slot) in topological order, so that a run is a loop over the
+        nodes instead of a recursion. The output slots are allocated once,
+        and the output record is made of the outputs of the ImageToDataNodes
+        in the order of the tree.
+
+        """
+        nodes = list(
+            PreOrderIter(
+                self.root, stop=lambda node: isinstance(node.parent, ImageToDataNode)
+            )
+        )
+        i_slots = {node: i for i, node in enumerate(nodes)}
+        self._plan = [
+            (node, i_slots[node.parent] if node.parent is not None else -1)
+            for node in nodes
+        ]
+        self._slots = [None] * len(nodes)
+        self._data_slots = [
+            i for i, node in enumerate(nodes) if isinstance(node, ImageToDataNode)
+        ]
+        self._output_type = None
+
+    @property
+    def diagnostic_image(self):
+        imname = self.all_params["diagnostics"].image
+        if imname == "unprocessed":
+            return None
+        # if we are setting the diagnostic image to one from the nodes,
+        # navigate to the node and select the proper diagnostic image
+        try:
+            return self.node_dict["/".join(imname.split("/")[:-1])].diagnostic_image
+        except KeyError:
+            return None
+
+    def serialize_changed_params(self):
+        chg = {n: p.params.changed_values() for n, p in self.all_params.items()}
+        for p in self.all_params.values():
+            p.params.acknowledge_changes()
+        return chg
+
+    def serialize_params(self):
+        return {n: p.params.values for n, p in self.all_params.items()}
+
+    def deserialize_params(self, rec_params):
+        for item, vals in rec_params.items():
+            self.all_params[item].params.values = vals
+            if item != "diagnostics" and item != "reset":
+                self.node_dict[item].changed(vals)
+        if "diagnostics" in rec_params.keys():
+            imname = self.all_params["diagnostics"].image
+            if imname == "unprocessed":
+                for node in self.node_dict.values():
+                    node.set_diagnostic = None
+            else:
+                try:
+                    self.node_dict[
+                        "/".join(imname.split("/")[:-1])
+                    ].set_diagnostic = imname.split("/")[-1]
+                except KeyError:  # this can happen on reloading if the pipeline is changed
+                    self.all_params["diagnostics"].image = "unprocessed"
+        # reset group always exists, checks if there are actual changes (the second and)
+        if "reset" in rec_params.keys() and "reset" in rec_params["reset"].keys():
+            for node in self.node_dict.values():
+                node.reset()
+
+    def recursive_run(self, node: PipelineNode, *input_data):
+        output = node.process(*input_data)
+        if isinstance(node, ImageToDataNode):
+            return output
+
+        child_outputs = tuple(
+            self.recursive_run(child, output.data) for child in node.children
+        )
+        if node._output_type is None or node.output_type_changed:
+            node._output_type = namedtuple(
+                "o", chain.from_iterable(map(lambda x: x.data._fields, child_outputs))
+            )
+
+        # collect all diagnostic messages and return a named tuple collecting
+        # all the outputs
+
+        # first element of the tuple concatenates all lists of diagnostic messages
+        # second element makes a named tuple with fields from all the child named tuples
+        output_tuple = node._output_type(
+            *(chain.from_iterable(map(lambda x: x.data, child_outputs)))
+        )
+        return NodeOutput(
+            output.messages
+            + list(chain.from_iterable(map(lambda x: x.messages, child_outputs))),
+            output_tuple,
+        )
+
+    def run(self, input):
+        slots = self._slots
+        messages = []
+        for i_slot, (node, i_parent) in enumerate(self._plan):
+            output = node.process(input if i_parent < 0 else slots[i_parent])
+            messages.extend(output.messages)
+            slots[i_slot] = output.data
+
+        # the layout of the output record changes only if a node signals it
+        if self._output_type is None or self.root.output_type_changed:
+            self._output_type = namedtuple(
+                "o", chain.from_iterable(slots[i]._fields for i in self._data_slots)
+            )
+        out = NodeOutput(
+            messages,
+            self._output_type(*chain.from_iterable(slots[i] for i in self._data_slots)),
+        )
+        self.root.acknowledge_changes()
+        return out
+
+    def synchronize_state(self, data):
+        """ Applies the state updates of the synchronized nodes to
+        the pipeline output, has to be called in frame order
+        """
+        for node in self.node_dict.values():
+            if node.parallel_policy == "synchronized":
+                data = node.synchronize(data)
+        return data
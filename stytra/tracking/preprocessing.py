@@ -12,9 +12,40 @@ from stytra.tracking.pipelines import ImageToImageNode, NodeOutput
 
 
 class Prefilter(ImageToImageNode):
+    """ Downscales, smooths, inverts and clips the image. The steps write
+    into buffers which are kept between frames and reallocated only when
+    the shape of the image or the scale change, and the inversion and
+    clipping are done in one saturating subtraction.
+
+    If crop_to_roi is set and the tracking nodes using the output declare
+    the regions they need (see PipelineNode.input_roi), only the union of
+    these regions is processed, and the nodes get its position in the
+    complete image. The result is the same as for the complete image if
+    1/image_scale is an integer.
+
+    The output is overwritten at the next frame.
+    """
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, name="filtering", **kwargs)
         self.diagnostic_image_options = ["filtered"]
+        self._buffer_key = None
+        self._scaled = None
+        self._filtered = None
+        self._diagnostic = None
+
+    def _update_buffers(self, im, image_scale):
+        key = (im.shape, im.dtype, image_scale)
+        if key == self._buffer_key:
+            return
+        self._buffer_key = key
+        if image_scale != 1:
+            self._scaled = cv2.resize(
+                im, None, fx=image_scale, fy=image_scale, interpolation=cv2.INTER_AREA
+            )
+        else:
+            self._scaled = None
+        self._filtered = np.empty_like(im if self._scaled is None else self._scaled)
 
     def _process(
         self,
@@ -23,6 +54,7 @@ class Prefilter(ImageToImageNode):
         filter_size: Param(2, (0, 15)),
         color_invert: Param(True),
         clip: Param(140, (0, 255)),
+        crop_to_roi: Param(True),
         **extraparams
     ):
         """ Optionally resizes, smooths and inverts the image
@@ -32,24 +64,81 @@ class Prefilter(ImageToImageNode):
         :param filter_size:
         :param image_scale:
         :param color_invert:
+        :param crop_to_roi:
         :return:
         """
+        full_shape = _scaled_shape(im.shape, image_scale)
+        roi = self.children_roi(full_shape) if crop_to_roi else None
+        self.output_origin = (0, 0)
+        self.output_full_shape = None
+        if roi is not None:
+            im = self._crop(im, full_shape, roi, image_scale, filter_size)
+
+        self._update_buffers(im, image_scale)
         if image_scale != 1:
             im = cv2.resize(
-                im, None, fx=image_scale, fy=image_scale, interpolation=cv2.INTER_AREA
+                im,
+                None,
+                fx=image_scale,
+                fy=image_scale,
+                interpolation=cv2.INTER_AREA,
+                dst=self._scaled,
             )
         if filter_size > 0:
-            im = cv2.boxFilter(im, -1, (filter_size, filter_size))
+            im = cv2.boxFilter(
+                im, -1, (filter_size, filter_size), dst=self._filtered
+            )
+        # max(255 - im, clip) - clip and max(im, clip) - clip, with the
+        # saturation of the subtraction doing the clipping
         if color_invert:
-            im = 255 - im
-        if clip > 0:
-            im = np.maximum(im, clip) - clip
+            im = cv2.subtract(255 - clip, im, dst=self._filtered)
+        elif clip > 0:
+            im = cv2.subtract(im, clip, dst=self._filtered)
 
         if self.set_diagnostic == "filtered":
-            self.diagnostic_image = im
+            self.diagnostic_image = self._uncropped(im, full_shape)
 
         return NodeOutput([], im)
 
+    def _crop(self, im, full_shape, roi, image_scale, filter_size):
+        """ Crops the input to the region of the output needed by the
+        children, with a margin for the filter
+        """
+        margin = filter_size + 1
+        y_min, y_max, x_min, x_max = roi
+        oy = int(np.clip(np.floor(y_min) - margin, 0, full_shape[0]))
+        ox = int(np.clip(np.floor(x_min) - margin, 0, full_shape[1]))
+        y_max = int(np.clip(np.ceil(y_max) + margin, 0, full_shape[0]))
+        x_max = int(np.clip(np.ceil(x_max) + margin, 0, full_shape[1]))
+        if y_max - oy < 2 or x_max - ox < 2:
+            return im
+        self.output_origin = (oy, ox)
+        self.output_full_shape = full_shape
+        return im[
+            int(round(oy / image_scale)) : int(round(y_max / image_scale)),
+            int(round(ox / image_scale)) : int(round(x_max / image_scale)),
+        ]
+
+    def _uncropped(self, im, full_shape):
+        """ The output in a complete image, for display """
+        if self.output_full_shape is None:
+            return im
+        if self._diagnostic is None or self._diagnostic.shape != full_shape:
+            self._diagnostic = np.zeros(full_shape, im.dtype)
+        self._diagnostic[:] = 0
+        oy, ox = self.output_origin
+        h = min(im.shape[0], full_shape[0] - oy)
+        w = min(im.shape[1], full_shape[1] - ox)
+        self._diagnostic[oy : oy + h, ox : ox + w] = im[:h, :w]
+        return self._diagnostic
+
+
+def _scaled_shape(shape, image_scale):
+    """ Shape of an image resized by image_scale with cv2.resize """
+    if image_scale == 1:
+        return shape
+    return tuple(int(round(n * image_scale)) for n in shape)
+
 
 @vectorize([uint8(float32, uint8)])
 def negdif(xf, y):
@@ -96,6 +185,12 @@ def absdif(xf, y):
 
 
 class BackgroundSubtractor(ImageToImageNode):
+    """ Subtracts a slowly-updating background estimate. With parallel
+    tracking, each worker learns its own background from the frames it gets.
+    """
+
+    parallel_policy = "replicated"
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, name="bgsub", **kwargs)
         self.background_image = None
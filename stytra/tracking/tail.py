@@ -1,7 +1,7 @@
 import numpy as np
-from numba import jit
+from functools import lru_cache
+from numba import jit, prange
 from lightparam import Param, Parametrized
-from scipy.ndimage.filters import gaussian_filter1d
 from stytra.utilities import reduce_to_pi
 from stytra.tracking.pipelines import ImageToDataNode, NodeOutput
 from collections import namedtuple
@@ -30,13 +30,32 @@ class TailTrackingMethod(ImageToDataNode):
 
 
 class CentroidTrackingMethod(TailTrackingMethod):
-    """Center-of-mass method to find consecutive segments."""
+    """Center-of-mass method to find consecutive segments.
+
+    The zeroing of the resting angles and the time filter carry state from
+    frame to frame, when the tracking is parallelized they are applied
+    in frame order by the reordering stage.
+    """
+
+    parallel_policy = "synchronized"
+
+    # margin around the resting tail of the region of the image which is
+    # tracked, as a fraction of the tail length
+    roi_margin = 0.6
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.resting_angles = None
         self.previous_angles = None
 
+    def input_roi(self, shape):
+        return _tails_roi(
+            np.array([self._params.tail_start]) * shape[0],
+            np.array([self._params.tail_length]) * shape[0],
+            self.roi_margin,
+            self._params.window_size,
+        )
+
     def _process(
         self,
         im,
@@ -86,7 +105,9 @@ class CentroidTrackingMethod(TailTrackingMethod):
         start_y, start_x = tail_start
         tail_length_y, tail_length_x = tail_length
 
-        scale = im.shape[0]
+        # the image can be a region of the complete one
+        full_shape, (origin_y, origin_x) = self.input_geometry(im)
+        scale = full_shape[0]
 
         # Calculate tail length:
         length_tail = np.sqrt(tail_length_x ** 2 + tail_length_y ** 2) * scale
@@ -94,44 +115,42 @@ class CentroidTrackingMethod(TailTrackingMethod):
         # Segment length from tail length and n of segments:
         seg_length = length_tail / n_segments
 
-        n_segments += 1
-
         # Initial displacements in x and y:
-        disp_x = tail_length_x * scale / n_segments
-        disp_y = tail_length_y * scale / n_segments
-
-        angles = np.full(n_segments - 1, np.nan)
-        start_x *= scale
-        start_y *= scale
-
-        halfwin = window_size / 2
-        for i in range(1, n_segments):
-            # Use next segment function for find next point
-            # with center-of-mass displacement:
-            start_x, start_y, disp_x, disp_y, acc = _next_segment(
-                im, start_x, start_y, disp_x, disp_y, halfwin, seg_length
-            )
-            if start_x < 0:
-                messages.append("W:segment {} not detected".format(i))
-                break
+        disp_x = tail_length_x * scale / (n_segments + 1)
+        disp_y = tail_length_y * scale / (n_segments + 1)
+
+        # the whole tail is traced, smoothed and resampled in one jitted call
+        angles, n_found = _trace_tail(
+            im,
+            start_x * scale,
+            start_y * scale,
+            disp_x,
+            disp_y,
+            seg_length,
+            n_segments,
+            _window_offsets(window_size),
+            window_size / 2,
+            origin_x,
+            origin_y,
+            tail_filter_width,
+            n_output_segments,
+        )
+        if n_found < n_segments:
+            messages.append("W:segment {} not detected".format(n_found + 1))
 
-            abs_angle = np.arctan2(disp_x, disp_y)
-            angles[i - 1] = abs_angle
+        if not self.synchronized_externally:
+            angles = self._update_state(angles, reset_zero, time_filter_weight)
 
-        # we want angles to be continuous, this removes potential 2pi discontinuities
-        angles = np.unwrap(angles)
+        if self._output_type is None:
+            self.reset()
 
-        # we do not need to record a large amount of angles
-        if tail_filter_width > 0:
-            angles = gaussian_filter1d(angles, tail_filter_width, mode="nearest")
-
-        angles = np.interp(
-            np.linspace(0, 1, n_output_segments),
-            np.linspace(0, 1, n_segments - 1),
-            angles,
-        )
-        # Interpolate to the desired number of output segments
+        angles = angles.tolist()
+        return NodeOutput(messages, self._output_type(_tail_sum(angles), *angles))
 
+    def _update_state(self, angles, reset_zero, time_filter_weight):
+        """ Applies the zeroing and the time filter, which depend on
+        the previous frames
+        """
         if reset_zero:
             if self.resting_angles is None or len(self.resting_angles) != len(angles):
                 self.resting_angles = angles
@@ -148,15 +167,380 @@ class CentroidTrackingMethod(TailTrackingMethod):
             )
 
         self.previous_angles = angles
+        return angles
+
+    def synchronize(self, data):
+        if self._output_type is None:
+            self.reset()
+        angle_fields = self._output_type._fields[1:]
+        try:
+            angles = np.array([getattr(data, f) for f in angle_fields])
+        except AttributeError:  # the output type is being changed
+            return data
+        angles = self._update_state(
+            angles, self._params.reset_zero, self._params.time_filter_weight
+        )
+        return data._replace(
+            tail_sum=_tail_sum(angles), **dict(zip(angle_fields, angles))
+        )
+
+
+class MultiTailTrackingMethod(TailTrackingMethod):
+    """Center-of-mass tail tracking of several embedded fish, e.g. one
+    per well of a plate. The wells are laid out in a grid of n_rows by
+    n_columns: tail_start is the start of the tail in the first well,
+    grid_end in the last one, and all the tails have the same tail_length.
+    All the tails are traced in one jitted call, parallelized across
+    the fish.
+
+    The output has the tail sum and the angles of each fish, with the
+    f{i}_ prefix, the wells being numbered row by row.
+    """
+
+    roi_margin = CentroidTrackingMethod.roi_margin
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.monitored_headers = ["f0_tail_sum"]
+        self._definitions_key = None
+        self._definitions = None
+
+    def changed(self, vals):
+        if any(
+            p in vals.keys() for p in ["n_output_segments", "n_rows", "n_columns"]
+        ):
+            self.reset()
+
+    def reset(self):
+        n_fish = self._params.n_rows * self._params.n_columns
+        self._output_type = namedtuple(
+            "t",
+            [
+                "f{:d}_{}".format(i_fish, name)
+                for i_fish in range(n_fish)
+                for name in ["tail_sum"]
+                + [
+                    "theta_{:02}".format(i)
+                    for i in range(self._params.n_output_segments)
+                ]
+            ],
+        )
+        self._output_type_changed = True
+
+    def tail_definitions(self, scale, tail_start, tail_length, grid_end, n_rows, n_columns):
+        """ Starts and lengths of the tails in pixels, as (y, x) arrays
+        of shape (n_fish, 2), recomputed only if the grid changes
+        """
+        key = (scale, tail_start, tail_length, grid_end, n_rows, n_columns)
+        if key != self._definitions_key:
+            starts = tail_grid(tail_start, grid_end, n_rows, n_columns) * scale
+            lengths = np.tile(np.array(tail_length) * scale, (len(starts), 1))
+            self._definitions = starts, lengths
+            self._definitions_key = key
+        return self._definitions
+
+    def input_roi(self, shape):
+        starts, lengths = self.tail_definitions(
+            shape[0],
+            self._params.tail_start,
+            self._params.tail_length,
+            self._params.grid_end,
+            self._params.n_rows,
+            self._params.n_columns,
+        )
+        return _tails_roi(starts, lengths, self.roi_margin, self._params.window_size)
+
+    def _process(
+        self,
+        im,
+        tail_start: Param((0.1, 0.2), gui=False),
+        tail_length: Param((0.0, -0.15), gui=False),
+        grid_end: Param((0.9, 1.2), gui=False),
+        n_rows: Param(4, (1, 16)),
+        n_columns: Param(6, (1, 24)),
+        n_segments: Param(10, (1, 50)),
+        tail_filter_width: Param(0.0, (0.0, 10.0)),
+        n_output_segments: Param(7, (2, 30)),
+        window_size: Param(7, (1, 15)),
+        **extraparams
+    ):
+        """Finds the tails of all the fish in the grid
+
+        Parameters
+        ----------
+        im :
+            image to process
+        tail_start :
+            starting point (y, x) of the tail in the first well
+        tail_length :
+            tail length (y, x), the same for all the wells
+        grid_end :
+            starting point (y, x) of the tail in the last well
+        n_rows :
+            number of rows of wells
+        n_columns :
+            number of columns of wells
+        n_segments :
+            number of segments traced
+        tail_filter_width :
+            width of the gaussian filter along the tail, 0 for none
+        n_output_segments :
+            number of angles in the output for each fish
+        window_size :
+            window size in pixel for center-of-mass calculation
+
+        Returns
+        -------
+        the tail sum and the angles of each fish
+
+        """
+        full_shape, (origin_y, origin_x) = self.input_geometry(im)
+        starts, lengths = self.tail_definitions(
+            full_shape[0], tail_start, tail_length, grid_end, n_rows, n_columns
+        )
+
+        angles, n_found = _trace_tails(
+            im,
+            starts,
+            lengths,
+            n_segments,
+            _window_offsets(window_size),
+            window_size / 2,
+            origin_x,
+            origin_y,
+            tail_filter_width,
+            n_output_segments,
+        )
+        messages = []
+        if n_found.min() < n_segments:
+            messages.append(
+                "W:tail not detected in wells {}".format(
+                    ", ".join(str(i) for i in np.flatnonzero(n_found < n_segments))
+                )
+            )
 
         if self._output_type is None:
             self.reset()
 
-        # Total curvature as sum of the last 2 angles - sum of the first 2
+        tail_sums = angles[:, -1] + angles[:, -2] - angles[:, 0] - angles[:, 1]
         return NodeOutput(
             messages,
-            self._output_type(angles[-1] + angles[-2] - angles[0] - angles[1], *angles),
+            self._output_type(*np.column_stack([tail_sums, angles]).ravel().tolist()),
+        )
+
+
+def tail_grid(first_start, last_start, n_rows, n_columns):
+    """ Starting points of the tails in a grid of wells, row by row, as an
+    array of (y, x) of shape (n_rows*n_columns, 2)
+    """
+    first_start = np.array(first_start, dtype=np.float64)
+    last_start = np.array(last_start, dtype=np.float64)
+    rows = np.linspace(0, 1, n_rows) if n_rows > 1 else np.zeros(1)
+    columns = np.linspace(0, 1, n_columns) if n_columns > 1 else np.zeros(1)
+    fractions = np.stack(np.meshgrid(rows, columns, indexing="ij"), -1).reshape(-1, 2)
+    return first_start + fractions * (last_start - first_start)
+
+
+def _tails_roi(starts, lengths, margin_fraction, window_size):
+    """ Bounding box (y_min, y_max, x_min, x_max) of the tails with starts
+    and lengths in pixels, with a margin proportional to the tail length
+    """
+    ends = starts + lengths
+    margin = (
+        margin_fraction * np.max(np.sqrt(np.sum(lengths ** 2, 1))) + window_size
+    )
+    y_min, x_min = np.minimum(starts, ends).min(0) - margin
+    y_max, x_max = np.maximum(starts, ends).max(0) + margin
+    return y_min, y_max, x_min, x_max
+
+
+def _tail_sum(angles):
+    """ Total curvature as sum of the last 2 angles - sum of the first 2 """
+    return angles[-1] + angles[-2] - angles[0] - angles[1]
+
+
+@lru_cache(maxsize=None)
+def _window_offsets(window_size):
+    """ (y, x) offsets of the pixels of the circular center-of-mass window
+    from its top-left corner
+    """
+    halfwin = window_size / 2
+    return np.array(
+        [
+            (y, x)
+            for x in range(window_size)
+            for y in range(window_size)
+            if (halfwin - x) ** 2 + (halfwin - y) ** 2 <= halfwin ** 2
+        ],
+        dtype=np.int64,
+    ).reshape(-1, 2)
+
+
+@jit(nopython=True, cache=True)
+def _trace_tail(
+    im,
+    xm,
+    ym,
+    dx,
+    dy,
+    seg_length,
+    n_segments,
+    offsets,
+    halfwin,
+    origin_x,
+    origin_y,
+    filter_width,
+    n_output_segments,
+):
+    """Traces the tail with consecutive center-of-mass windows, and returns
+    the unwrapped, smoothed and resampled segment angles.
+
+    Parameters
+    ----------
+    im :
+        image, possibly a region of the complete one
+    xm, ym :
+        starting point in the complete image
+    dx, dy :
+        initial displacement
+    seg_length :
+        length of the segments
+    n_segments :
+        number of segments
+    offsets :
+        window pixels, from _window_offsets
+    halfwin :
+        half of the window size
+    origin_x, origin_y :
+        position of im in the complete image
+    filter_width :
+        width of the gaussian filter along the tail, 0 for none
+    n_output_segments :
+        number of angles returned
+
+    Returns
+    -------
+    the angles and the number of segments found
+
+    """
+    y_max, x_max = im.shape
+    angles = np.full(n_segments, np.nan)
+    n_found = 0
+    for i in range(n_segments):
+        xs = int(round(xm + dx - halfwin))
+        ys = int(round(ym + dy - halfwin))
+        acc = 0.0
+        acc_x = 0.0
+        acc_y = 0.0
+        for j in range(offsets.shape[0]):
+            y = ys + offsets[j, 0]
+            x = xs + offsets[j, 1]
+            y_im = y - origin_y
+            x_im = x - origin_x
+            if 0 <= y_im < y_max and 0 <= x_im < x_max:
+                value = im[y_im, x_im]
+                acc_x += x * value
+                acc_y += y * value
+                acc += value
+        if acc == 0:
+            break
+
+        # center of mass relative to the starting point, normalised to
+        # the segment length
+        mn_x = acc_x / acc - xm
+        mn_y = acc_y / acc - ym
+        a = np.sqrt(mn_y ** 2 + mn_x ** 2) / seg_length
+        if a == 0:
+            break
+        dx = mn_x / a
+        dy = mn_y / a
+        xm += dx
+        ym += dy
+        angles[i] = np.arctan2(dx, dy)
+        n_found += 1
+
+    # angles are continuous, as with np.unwrap
+    correction = 0.0
+    previous = angles[0]
+    for i in range(1, n_segments):
+        diff = angles[i] - previous
+        previous = angles[i]
+        if abs(diff) >= np.pi:
+            diff_mod = (diff + np.pi) % (2 * np.pi) - np.pi
+            if diff_mod == -np.pi and diff > 0:
+                diff_mod = np.pi
+            correction += diff_mod - diff
+        elif not abs(diff) < np.pi:
+            correction = np.nan
+        angles[i] += correction
+
+    # gaussian filter with the borders extended, as gaussian_filter1d
+    if filter_width > 0:
+        radius = int(4.0 * filter_width + 0.5)
+        weights = np.exp(
+            -0.5 / filter_width ** 2 * np.arange(-radius, radius + 1) ** 2
+        )
+        weights /= weights.sum()
+        filtered = np.zeros(n_segments)
+        for i in range(n_segments):
+            for k in range(2 * radius + 1):
+                i_source = min(max(i + k - radius, 0), n_segments - 1)
+                filtered[i] += weights[k] * angles[i_source]
+        angles = filtered
+
+    return (
+        np.interp(
+            np.linspace(0, 1, n_output_segments),
+            np.linspace(0, 1, n_segments),
+            angles,
+        ),
+        n_found,
+    )
+
+
+@jit(nopython=True, parallel=True, cache=True)
+def _trace_tails(
+    im,
+    starts,
+    lengths,
+    n_segments,
+    offsets,
+    halfwin,
+    origin_x,
+    origin_y,
+    filter_width,
+    n_output_segments,
+):
+    """Traces several tails, with starts and lengths as (y, x) arrays of
+    shape (n_fish, 2) in pixels, in parallel.
+
+    Returns
+    -------
+    the angles of each fish as an array of shape (n_fish, n_output_segments)
+    and the number of segments found for each fish
+
+    """
+    n_fish = starts.shape[0]
+    angles = np.empty((n_fish, n_output_segments))
+    n_found = np.empty(n_fish, np.int64)
+    for i in prange(n_fish):
+        length = np.sqrt(lengths[i, 0] ** 2 + lengths[i, 1] ** 2)
+        angles[i, :], n_found[i] = _trace_tail(
+            im,
+            starts[i, 1],
+            starts[i, 0],
+            lengths[i, 1] / (n_segments + 1),
+            lengths[i, 0] / (n_segments + 1),
+            length / n_segments,
+            n_segments,
+            offsets,
+            halfwin,
+            origin_x,
+            origin_y,
+            filter_width,
+            n_output_segments,
         )
+    return angles, n_found
 
 
 @jit(nopython=True, cache=True)
@@ -1,5 +1,8 @@
 from queue import Empty, Full
 from multiprocessing import Event, Value
+from datetime import datetime
+import heapq
+import time as pytime
 
 from stytra.utilities import FrameProcess
 from arrayqueues.shared_arrays import TimestampedArrayQueue
@@ -27,6 +30,8 @@ class TrackingProcess(FrameProcess):
         recording_signal=None,
         gui_framerate=30,
         max_mb_queue=100,
+        worker_index=None,
+        estimator=None,
         **kwargs
     ):
         """
@@ -54,6 +59,15 @@ class TrackingProcess(FrameProcess):
         max_mb_queue: int (200)
             the maximal size of the image output queues
 
+        worker_index: int (optional)
+            if set, the process is one of the workers of a parallel tracking
+            pool: the outputs are tagged with the frame index for reordering,
+            the synchronized state is left to the reordering stage and only
+            the first worker sends frames to the GUI
+
+        estimator: OnlineEstimator (optional)
+            closed-loop estimator updated with every tracking output
+
         kwargs
         """
 
@@ -78,6 +92,8 @@ class TrackingProcess(FrameProcess):
 
         self.pipeline_cls = pipeline
         self.pipeline = None
+        self.worker_index = worker_index
+        self.estimator = estimator
 
         self.i = 0
 
@@ -109,7 +125,7 @@ class TrackingProcess(FrameProcess):
         """Loop where the tracking function runs."""
 
         self.pipeline = self.pipeline_cls()
-        self.pipeline.setup()
+        self.pipeline.setup(synchronize_externally=self.worker_index is not None)
 
         while not self.finished_signal.is_set():
 
@@ -137,18 +153,22 @@ class TrackingProcess(FrameProcess):
             for msg in messages + new_messages:
                 self.message_queue.put(msg)
 
-            self.output_queue.put(time, output)
+            self.output_queue.put(time, output, frame_idx)
+
+            if self.estimator is not None:
+                self.estimator.process(time.timestamp(), output)
 
             # calculate the frame rate
             self.update_framerate()
 
             # put current frame into the GUI queue
-            self.send_to_gui(
-                time,
-                self.pipeline.diagnostic_image
-                if self.pipeline.diagnostic_image is not None
-                else frame,
-            )
+            if not self.worker_index:
+                self.send_to_gui(
+                    time,
+                    self.pipeline.diagnostic_image
+                    if self.pipeline.diagnostic_image is not None
+                    else frame,
+                )
 
         return
 
@@ -169,6 +189,144 @@ class TrackingProcess(FrameProcess):
         self.i = (self.i + 1) % every_x
 
 
+class OrderedFrameBuffer:
+    """ Collects outputs arriving out of order from parallel
+    tracking workers and releases them in frame-index order.
+
+    If more than max_pending outputs are waiting for a missing frame,
+    the frame is considered lost and skipped.
+
+    Parameters
+    ----------
+    max_pending: int
+        maximal number of outputs held back waiting for an earlier frame
+
+    """
+
+    def __init__(self, max_pending=32):
+        self.max_pending = max_pending
+        self.heap = []
+        self.next_idx = None
+        self.n_skipped = 0
+        self.n_late = 0
+
+    def put(self, frame_idx, item):
+        if self.next_idx is not None and frame_idx < self.next_idx:
+            self.n_late += 1
+            return
+        heapq.heappush(self.heap, (frame_idx, item))
+
+    def pop_ready(self):
+        """ Yields the items which are next in order
+        """
+        while self.heap:
+            frame_idx, item = self.heap[0]
+            if self.next_idx is None:
+                self.next_idx = frame_idx
+            if frame_idx != self.next_idx:
+                if len(self.heap) <= self.max_pending:
+                    return
+                self.n_skipped += frame_idx - self.next_idx
+            heapq.heappop(self.heap)
+            self.next_idx = frame_idx + 1
+            yield item
+
+
+class TrackingReorderProcess(FrameProcess):
+    """ Reordering stage of a parallel tracking pool: collects the outputs of
+    the TrackingProcess workers, puts them back in frame order, applies the
+    state updates of the synchronized pipeline nodes and sends the results
+    to the tracking output queue.
+
+    """
+
+    def __init__(
+        self,
+        worker_queues,
+        output_queue,
+        finished_signal: Event = None,
+        pipeline=None,
+        processing_parameter_queue=None,
+        max_pending=32,
+        estimator=None,
+        **kwargs
+    ):
+        """
+        Parameters
+        ----------
+        worker_queues: list of SharedRecordRing
+            output queues of the tracking workers
+        output_queue: SharedRecordRing
+            tracking output queue
+        finished_signal: Event
+            signal for the end of the acquisition
+        pipeline: Pipeline
+            tracking pipeline class
+        processing_parameter_queue
+            queue for the tracking parameters
+        max_pending: int
+            how many outputs are held back waiting for a missing frame
+            before it is skipped
+        estimator: OnlineEstimator (optional)
+            closed-loop estimator updated with every tracking output
+        """
+        super().__init__(name="tracking_reorder", **kwargs)
+        self.worker_queues = worker_queues
+        self.output_queue = output_queue
+        self.finished_signal = finished_signal
+        self.pipeline_cls = pipeline
+        self.pipeline = None
+        self.processing_parameter_queue = processing_parameter_queue
+        self.max_pending = max_pending
+        self.estimator = estimator
+
+    def retrieve_params(self):
+        while True:
+            try:
+                param_dict = self.processing_parameter_queue.get(timeout=0.0001)
+                self.pipeline.deserialize_params(param_dict)
+            except Empty:
+                break
+
+    def run(self):
+        self.pipeline = self.pipeline_cls()
+        self.pipeline.setup()
+        buffer = OrderedFrameBuffer(self.max_pending)
+        n_skipped = 0
+
+        while not self.finished_signal.is_set():
+            self.retrieve_params()
+
+            received = False
+            for queue in self.worker_queues:
+                try:
+                    times, indices, records = queue.get_batch()
+                except Empty:
+                    continue
+                for t, frame_idx, record in zip(
+                    times.tolist(), indices.tolist(), records.tolist()
+                ):
+                    buffer.put(frame_idx, (t, queue.tuple_type._make(record)))
+                received = True
+
+            if not received:
+                pytime.sleep(0.0002)
+                continue
+
+            for t, output in buffer.pop_ready():
+                output = self.pipeline.synchronize_state(output)
+                self.output_queue.put(datetime.fromtimestamp(t), output)
+                if self.estimator is not None:
+                    self.estimator.process(t, output)
+                self.update_framerate()
+
+            if buffer.n_skipped > n_skipped:
+                self.message_queue.put(
+                    "W:{} frames lost in tracking".format(buffer.n_skipped - n_skipped)
+                )
+                n_skipped = buffer.n_skipped
+
+
 class DispatchProcess(FrameProcess):
     """ A class which handles taking frames from the camera and dispatch them to both a separate
     process (e.g. for saving a movie) and to a gui for display